@@ -0,0 +1,200 @@
+import pandas as pd
+import numpy as np
+import sys
+import logging
+
+
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(funcName)s "
+        "- line %(lineno)d"
+    )
+)
+logger.addHandler(log_handler)
+logger.setLevel(logging.INFO)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.2
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Returns great-circle distance in kilometres between two points (or arrays of points)
+    given in decimal degrees. Any missing coordinate results in `nan`."""
+    lat1, lng1, lat2, lng2 = (
+        np.radians(np.asarray(x, dtype=float)) for x in (lat1, lng1, lat2, lng2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def get_latlng(df):
+    """Returns best available coordinates for each row of `df` as 2 numpy arrays: address
+    coordinates where available, otherwise city coordinates, otherwise `nan`."""
+    coords = []
+    for axis in ("lat", "lng"):
+        values = np.full(len(df), np.nan)
+        for col in (f"city_{axis}", f"address_{axis}"):  # address takes precedence
+            if col in df.columns:
+                col_values = pd.to_numeric(df[col], errors="coerce").values
+                values = np.where(np.isnan(col_values), values, col_values)
+        coords.append(values)
+    lat, lng = coords
+    missing = np.isnan(lat) | np.isnan(lng)
+    lat[missing], lng[missing] = np.nan, np.nan
+    return lat, lng
+
+
+class GeoGridIndex:
+    """Grid index over the coordinates of web certificates, used to block (prune) candidate
+    certificates for a company project before any fuzzy scoring takes place.
+
+    Certificates are bucketed into cells at least `radius_km` wide so that a query only
+    needs to look at the block of cells surrounding a project before checking exact
+    great-circle distances. Certificates without any coordinates can't be ruled out and are
+    therefore returned for every query, and projects without any coordinates get every
+    certificate back.
+
+    Parameters:
+     - `web_df` (pd.DataFrame): wrangled CSP certificates containing `address_lat`,
+     `address_lng` and/or `city_lat`, `city_lng` columns.
+     - `radius_km` (float): search radius around each project.
+
+    """
+
+    def __init__(self, web_df, radius_km):
+        self.web_df = web_df
+        self.radius_km = radius_km
+        self.lat, self.lng = get_latlng(web_df)
+        located = ~np.isnan(self.lat)
+        self.unlocated_pos = np.flatnonzero(~located)
+        max_abs_lat = np.abs(self.lat[located]).max() if located.any() else 0
+        self.lat_step = radius_km / KM_PER_DEGREE_LAT
+        self.lng_step = radius_km / (
+            KM_PER_DEGREE_LAT * max(np.cos(np.radians(max_abs_lat)), 0.01)
+        )  # cells are sized for highest latitude so they're never narrower than radius
+        self.cells = (
+            pd.DataFrame(
+                {
+                    "row": np.floor(self.lat[located] / self.lat_step).astype(int),
+                    "col": np.floor(self.lng[located] / self.lng_step).astype(int),
+                    "pos": np.flatnonzero(located),
+                }
+            )
+            .groupby(["row", "col"])
+            .pos.apply(np.array)
+            .to_dict()
+        )
+        logger.debug(
+            f"indexed {located.sum()} located certificates into {len(self.cells)} cells "
+            f"({len(self.unlocated_pos)} certificates without coordinates)"
+        )
+
+    def query_positions(self, lat, lng):
+        """Returns sorted integer positions (as in `.iloc`) of certificates within
+        `radius_km` of given coordinates, along with all certificates lacking coordinates."""
+        if lat is None or lng is None or np.isnan(lat) or np.isnan(lng):
+            return np.arange(len(self.web_df))
+        row = int(np.floor(lat / self.lat_step))
+        col = int(np.floor(lng / self.lng_step))
+        widest_lat = min(abs(lat) + self.lat_step, 89.9)
+        lng_reach = max(
+            int(np.ceil(
+                self.radius_km
+                / (KM_PER_DEGREE_LAT * np.cos(np.radians(widest_lat)))
+                / self.lng_step
+            )),
+            1,
+        )  # only exceeds 1 for projects further north than all certificates
+        nearby = [
+            self.cells[(r, c)]
+            for r in (row - 1, row, row + 1)
+            for c in range(col - lng_reach, col + lng_reach + 1)
+            if (r, c) in self.cells
+        ]
+        if nearby:
+            nearby = np.concatenate(nearby)
+            distance = haversine_km(self.lat[nearby], self.lng[nearby], lat, lng)
+            nearby = nearby[distance <= self.radius_km]
+        else:
+            nearby = np.array([], dtype=int)
+        return np.sort(np.concatenate([nearby, self.unlocated_pos]))
+
+    def query(self, single_project_row):
+        """Returns subset of indexed certificates which are candidates for matching with
+        given company project (pd.Series or single-row pd.DataFrame), in original order."""
+        if isinstance(single_project_row, pd.DataFrame):
+            single_project_row = single_project_row.iloc[0]
+        lat, lng = get_latlng(single_project_row.to_frame().transpose())
+        return self.web_df.iloc[self.query_positions(lat[0], lng[0])].copy()
+
+
+def get_tokens(row):
+    """Returns set of blocking tokens for a wrangled company project or certificate row.
+    Tokens are prefixed with the field they come from, except for company names which share
+    a namespace since owners and contractors are sometimes swapped between sources. Titles
+    only contribute their acronyms and full wrangled value, since wrangled titles have no
+    word boundaries left."""
+    tokens = set()
+    for attr, prefix in (
+        ("contractor", "company"),
+        ("owner", "company"),
+        ("city", "city"),
+        ("street_name", "street_name"),
+        ("title", "title"),
+    ):
+        value = row.get(attr)
+        if isinstance(value, str) and value.strip():
+            tokens.add((prefix, value))
+    for attr in ("title", "owner", "contractor"):
+        acronyms = row.get(f"{attr}_acronyms")
+        if isinstance(acronyms, list):
+            tokens.update(("acronym", acronym) for acronym in acronyms)
+    return tokens
+
+
+class TokenIndex:
+    """Inverted index from wrangled tokens (see `get_tokens`) to the company projects
+    containing them, used to find which open projects a new certificate could possibly
+    match without scanning all of them.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): wrangled company projects to index. Projects are
+     keyed by their position in this dataframe. Optional - projects can also be added
+     one by one with `add`.
+
+    """
+
+    def __init__(self, company_projects=None):
+        self.postings = {}  # token -> set of project keys
+        self.project_tokens = {}  # project key -> set of tokens
+        if company_projects is not None:
+            for key, (_, row) in enumerate(company_projects.iterrows()):
+                self.add(key, row)
+
+    def add(self, key, row):
+        """Indexes wrangled project `row` under `key`, replacing any previous entry."""
+        self.remove(key)
+        tokens = get_tokens(row)
+        self.project_tokens[key] = tokens
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(key)
+
+    def remove(self, key):
+        """Removes project `key` from the index (e.g. once it gets closed)."""
+        for token in self.project_tokens.pop(key, ()):
+            self.postings[token].discard(key)
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def query(self, row):
+        """Returns sorted keys of indexed projects sharing at least one token with wrangled
+        certificate `row`."""
+        keys = set()
+        for token in get_tokens(row):
+            keys.update(self.postings.get(token, ()))
+        return sorted(keys)
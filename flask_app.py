@@ -6,7 +6,7 @@ import datetime
 from dateutil.parser import parse as parse_date
 import dateutil.relativedelta
 from utils import create_connection, load_config
-from wrangler import wrangle
+from wrangler import wrangle, get_wrangled_columns, add_wrangled_columns
 from matcher import match
 from scraper import scrape
 from communicator import process_as_feedback
@@ -342,6 +342,8 @@ def project_entry():
                     DELETE FROM company_projects WHERE job_number=%s AND company_id=%s
                 """, [new_entry["job_number"], session.get('company_id')])
                 conn.commit()
+        new_entry.update(get_wrangled_columns(pd.DataFrame([new_entry])).iloc[0].to_dict())
+        add_wrangled_columns("company_projects")
         with create_connection() as conn:
             conn.cursor().execute(f"""
                 INSERT INTO company_projects (company_id, {', '.join(list(new_entry.keys()))}) VALUES (%s, {','.join([' %s']*len(new_entry))})
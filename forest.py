@@ -0,0 +1,135 @@
+import numpy as np
+
+
+flat_forest_version = 2  # bump whenever layout of `flatten_forest` output changes
+
+
+def flatten_forest(clf):
+    """Flattens every tree of a fitted random forest classifier into a handful of contiguous
+    numpy arrays, with node ids that run across trees. Unlike scikit-learn's own trees,
+    which copy their nodes into private buffers when unpickled, these arrays can be saved
+    uncompressed and memory-mapped on load (see `matcher.load_forest`), so that every
+    process reading them shares a single read-only copy.
+
+    Parameters:
+     - `clf` (RandomForestClassifier): fitted single-output classifier.
+
+    Returns:
+     - a dict of numpy arrays:
+        - `roots`: node id of each tree's root.
+        - `children_left`, `children_right`: node ids of children, -1 for leaves.
+        - `feature`, `threshold`: split of each node (samples with
+        `feature <= threshold` go left).
+        - `value`: class probabilities of each node, normalized like
+        `DecisionTreeClassifier.predict_proba` does.
+        - `classes`: class labels, in the order of `value` columns.
+        - `max_depth`: depth of the deepest tree.
+        - `n_features`: number of features the forest was fitted on.
+        - `fingerprint`: `forest_fingerprint` of `clf`.
+        - `version`: `flat_forest_version`.
+
+    """
+    trees = [estimator.tree_ for estimator in clf.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    children_left, children_right, value = [], [], []
+    for tree, offset in zip(trees, offsets):
+        for children, tree_children in [
+            (children_left, tree.children_left),
+            (children_right, tree.children_right),
+        ]:
+            children.append(np.where(tree_children == -1, -1, tree_children + offset))
+        tree_value = tree.value[:, 0, : len(clf.classes_)]
+        normalizer = tree_value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value.append(tree_value / normalizer)
+    return {
+        "roots": offsets[:-1].astype(np.int32),
+        "children_left": np.concatenate(children_left).astype(np.int32),
+        "children_right": np.concatenate(children_right).astype(np.int32),
+        "feature": np.concatenate([tree.feature for tree in trees]).astype(np.int32),
+        "threshold": np.concatenate([tree.threshold for tree in trees]).astype(np.float64),
+        "value": np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+        "classes": np.asarray(clf.classes_),
+        "max_depth": np.int32(max(tree.max_depth for tree in trees)),
+        "n_features": np.int32(trees[0].n_features),
+        "fingerprint": forest_fingerprint(clf),
+        "version": np.int32(flat_forest_version),
+    }
+
+
+def forest_fingerprint(clf):
+    """Returns number of trees of fitted random forest `clf` followed by the node count of
+    each tree, which is practically never the same for two separately trained forests."""
+    node_counts = [estimator.tree_.node_count for estimator in clf.estimators_]
+    return np.array([len(node_counts)] + node_counts, dtype=np.int64)
+
+
+def flat_forest_matches(flat, clf):
+    """Returns whether flattened trees `flat` (see `flatten_forest`) have the current layout
+    and were flattened from random forest `clf`, rather than from another model that was
+    saved under the same name before or after.
+
+    Parameters:
+     - `flat` (dict): flattened forest, as returned by `flatten_forest`.
+     - `clf` (RandomForestClassifier): fitted classifier that `flat` is expected to mirror.
+
+    """
+    return (
+        "version" in flat
+        and int(flat["version"]) == flat_forest_version
+        and "fingerprint" in flat
+        and np.array_equal(flat["fingerprint"], forest_fingerprint(clf))
+    )
+
+
+def predict_forest_proba(flat, X, batch_size=10000):
+    """Vectorized counterpart of `RandomForestClassifier.predict_proba` over flattened trees
+    (see `flatten_forest`). All trees of a batch of samples get traversed at once, one
+    tree level per step, so that per-call overhead stays low enough for single pairs.
+
+    Features are cast to float32 and tree probabilities get summed up tree after tree, as
+    scikit-learn does, so probabilities are the same as the ones of the original forest.
+
+    Parameters:
+     - `flat` (dict): flattened forest, as returned by `flatten_forest`.
+     - `X` (array-like): feature matrix of shape `(n_samples, n_features)`.
+     - `batch_size` (int): number of samples traversed at once, which bounds memory use to
+     about `batch_size * n_trees * (n_classes + 2) * 8` bytes.
+
+    Returns:
+     - a numpy array of class probabilities of shape `(n_samples, n_classes)`.
+
+    Raises:
+     - `ValueError`: If `X` doesn't have the forest's number of features, or has missing
+     (NaN) or infinite values.
+
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim != 2 or X.shape[1] != flat["n_features"]:
+        raise ValueError(
+            f"expected {int(flat['n_features'])} features, got array of shape {X.shape}"
+        )
+    if not np.isfinite(X).all():
+        raise ValueError("features contain NaN or infinity, which scikit-learn rejects too")
+    roots, value = flat["roots"], flat["value"]
+    children_left, children_right = flat["children_left"], flat["children_right"]
+    feature, threshold = flat["feature"], flat["threshold"]
+    proba = np.empty((len(X), value.shape[1]), dtype=np.float64)
+    for start in range(0, len(X), batch_size):
+        X_batch = X[start:start + batch_size]
+        samples = np.repeat(np.arange(len(X_batch)), len(roots))
+        nodes = np.tile(roots.astype(np.intp), len(X_batch))
+        active = np.flatnonzero(children_left[nodes] != -1)  # (sample, tree) pairs not at a leaf yet
+        while len(active):
+            active_nodes = nodes[active]
+            goes_left = (
+                X_batch[samples[active], feature[active_nodes]] <= threshold[active_nodes]
+            )
+            nodes[active] = np.where(
+                goes_left, children_left[active_nodes], children_right[active_nodes]
+            )
+            active = active[children_left[nodes[active]] != -1]
+        leaf_values = value[nodes].reshape(len(X_batch), len(roots), value.shape[1])
+        # cumulative sum adds trees up one after the other, like scikit-learn's accumulation
+        proba[start:start + batch_size] = np.cumsum(leaf_values, axis=1)[:, -1] / len(roots)
+    return proba
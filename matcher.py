@@ -1,12 +1,39 @@
 import pandas as pd
+import numpy as np
 import datetime
-from wrangler import wrangle
+from wrangler import wrangle, clean_cache_info, wrangler_version
 from communicator import communicate
-from scorer import build_match_score
+from scorer import (
+    score_pairs,
+    concat_scored_pairs,
+    ScoredPairs,
+    get_fresh_certs,
+    record_cert_id_checks,
+    prefilter_score,
+    scorer_version,
+)
+from blocker import GeoGridIndex, TokenIndex
+from forest import predict_forest_proba, flat_forest_matches
 import pickle
-from utils import create_connection, load_config, update_results
+import joblib
+from utils import (
+    create_connection,
+    load_config,
+    update_results,
+    load_latest_recorded,
+    enable_profiling,
+    profiling_enabled,
+    pop_profile_stats,
+    merge_profile_stats,
+    record_profile_stats,
+)
 import re
+import os
 import sys
+import threading
+import heapq
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import logging
 import argparse
 import mysql.connector
@@ -32,13 +59,72 @@ try:
 except FileNotFoundError:  # no `.secret.json` file if running in CI
     pass
 
+model_registry = {}  # artifact path -> (file signature, unpickled object)
+model_registry_lock = threading.Lock()
+flat_forest_checks = {}  # version -> (model, flattened trees, whether they match)
+# wrangler and scorer versions the calibrated prefilter threshold holds for
+prefilter_version = f"{wrangler_version}.{scorer_version}"
+
+
+def get_artifact_path(artifact, version="status_quo"):
+    """Returns path of a pickled model artifact for a given version.
+
+    Parameters:
+    `artifact` (str): `model` or `features`.
+    `version` (str): `status_quo` for the production model, `new` (or any other prefix) for a
+    newly-trained model, or an archive date as `yyyy-mm-dd` (adopted models which were
+    retired on that date) or `new-yyyy-mm-dd` (new models which were rejected on that date).
+
+    """
+    if version == "status_quo":
+        return f"./rf_{artifact}.pkl"
+    archived = re.findall("^(new-)?(\d{4}-\d{2}-\d{2})$", version)
+    if archived:
+        new_prefix, archive_date = archived[0]
+        return f"./model_archive/rf_{'new_' if new_prefix else ''}{artifact}-{archive_date}.pkl"
+    return f"./{version}_rf_{artifact}.pkl"
+
+
+def load_artifact(path, mmap_mode=None):
+    """Returns unpickled object stored at `path`, keeping it in `model_registry` so that it
+    only gets unpickled once per process. The file is unpickled again whenever it changes
+    on disk (i.e. its modification time, size, or inode differs from the cached copy), which
+    is how long-lived processes pick up models swapped in by `ml.validate_model`.
+
+    Parameters:
+    `path` (str): path of the artifact.
+    `mmap_mode` (str): if set (e.g. `"r"`), the artifact is loaded by joblib, which
+    memory-maps numpy arrays of uncompressed joblib dumps instead of reading them into
+    memory. Processes mapping the same file share its pages, and a renamed or replaced
+    file stays mapped until its arrays are released.
+    
+    Raises:
+    `FileNotFoundError`: If there is no artifact at `path`.
+
+    """
+    with open(path, "rb") as input_file:
+        stat = os.fstat(input_file.fileno())
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with model_registry_lock:
+            cached = model_registry.get(path)
+            if cached and cached[0] == signature:
+                return cached[1]
+            logger.debug(f"unpickling {path}")
+            if mmap_mode:
+                artifact = joblib.load(path, mmap_mode=mmap_mode)
+            else:
+                artifact = pickle.load(input_file)
+            model_registry[path] = (signature, artifact)
+            return artifact
+
+
 def load_model(version="status_quo"):
-    """Unpickles random forest model `rf_model.pkl` from project's root directory and loads
-    it into memory.
+    """Loads random forest model `rf_model.pkl` from project's root directory (or model
+    archive) through `load_artifact`, so it is only unpickled again if the file changed.
     
     Parameters:
     `version` (str): default is `status_quo` but `new` can also be used for validating
-    newly-trained models.
+    newly-trained models. Archived models can be loaded too - see `get_artifact_path`.
 
     Returns:
     a trained instance of scikit-learn's RandomForestClassifier, which has been previously
@@ -46,27 +132,102 @@ def load_model(version="status_quo"):
     
     """
     logger.debug(f"loading {version} random forest classifier")
-    version = "" if version == "status_quo" else version + "_"
-    with open(f"./{version}rf_model.pkl", "rb") as input_file:
-        return pickle.load(input_file)
+    return load_artifact(get_artifact_path("model", version))
 
 
 def load_feature_list(version="status_quo"):
-    """Unpickles list of features used in matching version of `rf_model.pkl` from project's
-    root directory and loads it into memory.
+    """Loads list of features used in matching version of `rf_model.pkl` from project's
+    root directory (or model archive) through `load_artifact`.
     
     Parameters:
     `version` (str): default is `status_quo` but `new` can also be used for validating
-    newly-trained models.
+    newly-trained models. Archived models can be loaded too - see `get_artifact_path`.
 
     Returns:
     list of strings, each representing a feature (column) of the model (training data).
     
     """
     logger.debug(f"loading {version} features for learning model")
-    version = "" if version == "status_quo" else version + "_"
-    with open(f"./{version}rf_features.pkl", "rb") as input_file:
-        return pickle.load(input_file)
+    return load_artifact(get_artifact_path("features", version))
+
+
+def load_forest(version="status_quo"):
+    """Loads flattened trees of matching version of `rf_model.pkl` (see
+    `forest.flatten_forest`) from `rf_forest.pkl`, memory-mapped read-only through
+    `load_artifact`.
+
+    Parameters:
+    `version` (str): see `load_model`.
+
+    Returns:
+    a dict of read-only numpy arrays describing the forest.
+
+    Raises:
+    `FileNotFoundError`: If the model was saved before flattened trees were saved with it.
+
+    """
+    logger.debug(f"loading {version} flattened random forest")
+    return load_artifact(get_artifact_path("forest", version), mmap_mode="r")
+
+
+def predict_model_proba(
+    X,
+    version="status_quo",
+    backend=load_config()["machine_learning"]["inference_backend"],
+    flat_max_batch_size=load_config()["machine_learning"]["flat_max_batch_size"],
+):
+    """Returns class probabilities of feature matrix `X` according to model `version`.
+
+    Parameters:
+    `X` (np.array): features of samples, in the order of `load_feature_list`.
+    `version` (str): see `load_model`.
+    `backend` (str): `flat` for traversing flattened trees with numpy (see
+    `forest.predict_forest_proba`), which gives the same probabilities without
+    scikit-learn's per-call overhead, or `sklearn` for the model's own `predict_proba`.
+    Models saved before flattened trees were saved with them, and models whose flattened
+    trees on disk don't match them (see `flat_forest_matches`, e.g. after an archived model
+    got copied back into place, or while `ml.rename_artifacts` is midway), always go
+    through `sklearn`.
+    `flat_max_batch_size` (int): batches of more samples go through `sklearn` even with the
+    `flat` backend, since its compiled tree traversal wins over numpy on large batches.
+
+    """
+    clf = load_model(version=version)
+    if backend == "flat" and len(X) <= flat_max_batch_size:
+        try:
+            flat = load_forest(version=version)
+        except FileNotFoundError:
+            logger.debug(f"no flattened trees for {version} model, using scikit-learn")
+        else:
+            if check_flat_forest(flat, clf, version):
+                return predict_forest_proba(flat, X)
+    return clf.predict_proba(X)
+
+
+def check_flat_forest(flat, clf, version):
+    """Returns whether flattened trees `flat` were flattened from model `clf` of `version`
+    (see `forest.flat_forest_matches`). The outcome is kept in `flat_forest_checks` until
+    either artifact gets reloaded, so that the check doesn't add up on every prediction."""
+    with model_registry_lock:
+        cached = flat_forest_checks.get(version)
+        if cached and cached[0] is clf and cached[1] is flat:
+            return cached[2]
+        matches = flat_forest_matches(flat, clf)
+        if not matches:
+            logger.warning(
+                f"flattened trees don't match {version} model, using scikit-learn until "
+                "they do"
+            )
+        flat_forest_checks[version] = (clf, flat, matches)
+        return matches
+
+
+def get_model_id(version="status_quo"):
+    """Returns identifier of the model currently behind `version`, based on modification
+    time of its artifact. Unlike `version`, this stays the same for a given model when it
+    gets promoted or archived by `ml.validate_model`, since `os.rename` keeps mtime."""
+    mtime = os.stat(get_artifact_path("model", version)).st_mtime
+    return datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%dT%H:%M:%S")
 
 
 def predict_prob(sample, version="status_quo"):
@@ -92,9 +253,8 @@ def predict_prob(sample, version="status_quo"):
                 "Need to pass in a Pandas Series or filename of csv file within root"
                 " folder, whcih contsains a single row of data (after header)."
             )
-    clf = load_model(version=version)
     cols = load_feature_list(version=version)
-    prob = clf.predict_proba(sample[cols].values.reshape(1, -1))[0][1]
+    prob = predict_model_proba(sample[cols].values.reshape(1, -1), version=version)[0][1]
     return prob
 
 
@@ -123,6 +283,490 @@ def predict_match(prob, prob_thresh, multi_phase_proned, multi_phase_proned_thre
         return 0
 
 
+def flag_multi_phase(results):
+    """Flags every row of scored potential matches whose city or title suggests a project
+    at risk of having multiple phases (campus, hospital, etc.).
+
+    Parameters:
+     - `results` (pd.DataFrame): wrangled and scored potential matches.
+
+    Returns:
+     - a Pandas Series of 1 or 0 (multi-phase proned or not), aligned with `results`.
+
+    """
+    city_title = results.city.astype(str) + results.title.astype(str)
+    return city_title.str.contains("campus|hospital|university|college").astype(int)
+
+
+def predict_probs(samples, version="status_quo"):
+    """Predicts probability of match for many proposed matches at once. Vectorized
+    counterpart of `predict_prob`, which runs a single prediction over the whole feature
+    matrix (see `predict_model_proba`).
+
+    Parameters:
+     - `samples` (pd.DataFrame or scorer.ScoredPairs): table of pre-wranggled, pre-scored,
+     and pre-built proposed matches (typically all projects x certificates), or the compact
+     feature matrix of scored pairs.
+     - `version` (str): default is `status_quo` but `new` can also be used for validating
+     newly-trained models.
+
+    Returns:
+     - a numpy array of match probabilities, aligned with rows of `samples`.
+
+    """
+    if not len(samples):
+        return np.array([], dtype=float)
+    cols = load_feature_list(version=version)
+    if isinstance(samples, ScoredPairs):
+        return predict_model_proba(samples.get_matrix(cols), version=version)[:, 1]
+    return predict_model_proba(samples[cols].values, version=version)[:, 1]
+
+
+def predict_matches(probs, prob_thresh, multi_phase_proned, multi_phase_proned_thresh):
+    """Vectorized counterpart of `predict_match` operating on whole arrays of prediction
+    probabilities and multi-phase flags.
+
+    Returns:
+     - a numpy array of 1 or 0 (match or not)
+
+    """
+    thresh = np.where(
+        np.asarray(multi_phase_proned, dtype=bool), multi_phase_proned_thresh, prob_thresh
+    )
+    return (np.asarray(probs) >= thresh).astype(int)
+
+
+def predict_batch(
+    pairs,
+    df_web,
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    multi_phase_proned_thresh=load_config()["machine_learning"][
+        "prboability_thresholds"
+    ]["multi_phase"],
+    version="status_quo",
+):
+    """Predicts scored potential matches spanning any number of projects straight from
+    their feature matrix, using a single pass of the model.
+
+    Parameters:
+     - `pairs` (scorer.ScoredPairs): scored potential matches.
+     - `df_web` (pd.DataFrame): wrangled certificates `pairs` refer to.
+     - `prob_thresh` (float): probability threshold for decision boundary.
+     - `multi_phase_proned_thresh` (float): probability threshold for projects which are
+     identified as being at risk of having multiple phases.
+     - `version` (str): default is `status_quo` but `new` can also be used for validating
+     newly-trained models.
+
+    Returns:
+     - a Pandas DataFrame of `multi_phase_proned`, `pred_prob` and `pred_match` columns,
+     aligned with `pairs`.
+
+    """
+    if not len(pairs):
+        multi_phase_proned = np.array([], dtype=int)
+    else:
+        multi_phase_proned = flag_multi_phase(df_web).values[pairs.cert_pos]
+    pred_prob = predict_probs(pairs, version=version)
+    return pd.DataFrame(
+        {
+            "multi_phase_proned": multi_phase_proned,
+            "pred_prob": pred_prob,
+            "pred_match": predict_matches(
+                pred_prob, prob_thresh, multi_phase_proned, multi_phase_proned_thresh
+            ),
+        }
+    )
+
+
+def expand_predictions(pairs, predictions, company_projects, df_web):
+    """Returns scored and predicted potential matches as one dataframe, with certificate
+    attributes, features, project identifiers, and predictions (see `predict_batch`)."""
+    results = pairs.to_frame(company_projects, df_web)
+    for col in predictions.columns:
+        results[col] = predictions[col].values
+    return results
+
+
+def score_candidates(company_projects, candidates, features=None, first_project_pos=0):
+    """Scores each wrangled company project against its own set of wrangled candidate
+    certificates.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): wrangled company projects.
+     - `candidates` (iterable of pd.DataFrame): wrangled certificates to score against each
+     project, in the same order as `company_projects`. Their index must hold positions in
+     the certificates table being matched (see `scorer.score_pairs`).
+     - `features` (list-like): features to compute, typically the feature list of the
+     model about to be used. Passed on to `scorer.score_pairs`, which computes all
+     features if `None`.
+     - `first_project_pos` (int): position of first of `company_projects` within the
+     table of company projects being matched, when scoring a chunk of it.
+
+    Returns:
+     - list of `scorer.ScoredPairs` (one per project), positioned within the table of
+     company projects being matched.
+
+    """
+    scored = []
+    for project_pos, (_, company_project_row), project_candidates in zip(
+        itertools.count(first_project_pos), company_projects.iterrows(), candidates
+    ):
+        logger.info(
+            f"searching for potential match for project #{company_project_row['job_number']}..."
+        )
+        scored.append(
+            score_pairs(
+                company_project_row,
+                project_candidates,
+                project_pos=project_pos,
+                features=features,
+            )
+        )
+    return scored
+
+
+shared_web_df = None  # wrangled certificates set in each worker process by `init_worker`
+shared_geo_index = None
+shared_incremental = False
+shared_prefilter_thresh = None
+shared_features = None
+
+
+def get_candidates(
+    company_projects, df_web, geo_index=None, incremental=False, prefilter_thresh=None
+):
+    """Yields wrangled certificates to score against each of the wrangled company projects:
+    all of `df_web`, or only nearby ones if a `blocker.GeoGridIndex` over it is given, only
+    the ones above project's `last_cert_id_check` if `incremental`, and only the ones
+    passing first stage of the cascade (see `scorer.prefilter_score`) if `prefilter_thresh`
+    is given."""
+    for _, company_project_row in company_projects.iterrows():
+        candidates = geo_index.query(company_project_row) if geo_index else df_web
+        if incremental:
+            candidates = get_fresh_certs(company_project_row, candidates)
+        if prefilter_thresh is not None:
+            candidates = candidates[
+                prefilter_score(company_project_row, candidates) >= prefilter_thresh
+            ].copy()
+        yield candidates
+
+
+def init_worker(
+    df_web,
+    blocking_radius_km=None,
+    incremental=False,
+    prefilter_thresh=None,
+    features=None,
+    profiling=False,
+):
+    """Initializer of worker processes, which receive wrangled certificates (and build
+    optional `blocker.GeoGridIndex` over them) only once instead of with every chunk."""
+    global shared_web_df, shared_geo_index, shared_incremental, shared_prefilter_thresh
+    global shared_features
+    shared_web_df = df_web
+    shared_geo_index = GeoGridIndex(df_web, blocking_radius_km) if blocking_radius_km else None
+    shared_incremental = incremental
+    shared_prefilter_thresh = prefilter_thresh
+    shared_features = features
+    enable_profiling(profiling)
+
+
+def score_shared_candidates(company_projects, first_project_pos=0):
+    """Scores a chunk of wrangled company projects against certificates of worker process.
+    Returns scored pairs along with profile stats recorded while scoring them, if any (see
+    `utils.profile`)."""
+    scored = score_candidates(
+        company_projects,
+        get_candidates(
+            company_projects,
+            shared_web_df,
+            shared_geo_index,
+            shared_incremental,
+            shared_prefilter_thresh,
+        ),
+        features=shared_features,
+        first_project_pos=first_project_pos,
+    )
+    return scored, pop_profile_stats()
+
+
+def score_candidates_parallel(
+    company_projects,
+    df_web,
+    workers,
+    blocking_radius_km=None,
+    incremental=False,
+    prefilter_thresh=None,
+    features=None,
+):
+    """Splits wrangled company projects into chunks and scores them against wrangled
+    certificates `df_web` across a pool of `workers` processes.
+
+    Returns:
+     - list of `scorer.ScoredPairs` (one per project), in the same order as
+     `company_projects` regardless of which worker finished first.
+
+    """
+    if not len(company_projects):
+        return []
+    n_chunks = min(len(company_projects), workers * 4)
+    chunk_positions = np.array_split(np.arange(len(company_projects)), n_chunks)
+    chunks = [company_projects.iloc[positions] for positions in chunk_positions]
+    logger.info(f"scoring {len(company_projects)} projects across {workers} processes...")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(
+            df_web,
+            blocking_radius_km,
+            incremental,
+            prefilter_thresh,
+            features,
+            profiling_enabled(),
+        ),
+    ) as executor:
+        scored = []
+        for chunk_results, chunk_profile_stats in executor.map(
+            score_shared_candidates, chunks, [int(x[0]) for x in chunk_positions]
+        ):
+            scored.extend(chunk_results)
+            merge_profile_stats(chunk_profile_stats)
+        return scored
+
+
+match_score_cols = [
+    "contractor_score",
+    "contractor_pr_score",
+    "street_name_score",
+    "street_name_pr_score",
+    "street_number_score",
+    "street_number_pr_score",
+    "title_score",
+    "title_pr_score",
+    "city_score",
+    "city_pr_score",
+    "owner_score",
+    "owner_pr_score",
+    "geocode_proximity_score",
+    "total_score",
+    "multi_phase_proned",
+    "pred_prob",
+    "pred_match",
+]
+
+
+def create_match_scores_table():
+    """Creates `match_scores` table, which holds features and predictions of every scored
+    (project, certificate) pair, if it doesn't exist yet."""
+    create_query = f"""
+        CREATE TABLE IF NOT EXISTS match_scores (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            project_id INTEGER,
+            job_number VARCHAR(255),
+            cert_id INTEGER,
+            model_version VARCHAR(32),
+            model_id VARCHAR(32),
+            score_date DATE,
+            {', '.join(f'{col} DOUBLE' for col in match_score_cols)},
+            INDEX (project_id, cert_id),
+            INDEX (model_id)
+        )
+    """
+    with create_connection() as conn:
+        conn.cursor().execute(create_query)
+        conn.commit()
+
+
+def persist_match_scores(results, version="status_quo", batch_size=1000):
+    """Saves features and predictions of scored potential matches to `match_scores` table
+    using batched `executemany` inserts, so that they can be analysed later on without
+    going through wrangling, scoring and predicting all over again.
+
+    Parameters:
+     - `results` (pd.DataFrame): scored and predicted potential matches (output of
+     `report_matches`, `match`, etc.).
+     - `version` (str): version of model used to predict `results`.
+     - `batch_size` (int): number of rows to send per `executemany` call.
+
+    """
+    if not len(results):
+        return
+    create_match_scores_table()
+    cols = [col for col in match_score_cols if col in results.columns]
+    rows = pd.DataFrame(
+        {
+            "project_id": results.project_id if "project_id" in results.columns else None,
+            "job_number": results.job_number.astype(str),
+            "cert_id": results.cert_id,
+            "model_version": version,
+            "model_id": get_model_id(version),
+            "score_date": str(datetime.datetime.now().date()),
+            **{col: results[col] for col in cols},
+        }
+    )
+    rows = rows.astype(object).where(rows.notnull(), None)  # numpy types and nan to python
+    insert_query = f"""
+        INSERT INTO match_scores ({', '.join(rows.columns)})
+        VALUES ({', '.join(['%s'] * len(rows.columns))})
+    """
+    values = rows.values.tolist()
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(values), batch_size):
+            cursor.executemany(insert_query, values[start:start + batch_size])
+        conn.commit()
+    logger.info(f"persisted {len(values)} scored potential matches to `match_scores`")
+
+
+def load_match_scores(model_id=None, since=None):
+    """Returns persisted scores of potential matches from `match_scores` table, optionally
+    limited to a given `model_id` (see `get_model_id`) and/or to scores computed on or after
+    date `since` (str of format `"yyyy-mm-dd"`)."""
+    conditions, params = [], []
+    if model_id:
+        conditions.append("model_id=%s")
+        params.append(model_id)
+    if since:
+        conditions.append("score_date>=%s")
+        params.append(since)
+    scores_query = f"""
+        SELECT *
+        FROM match_scores
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+    """
+    with create_connection() as conn:
+        return pd.read_sql(scores_query, conn, params=params)
+
+
+def report_matches(
+    company_projects,
+    scored,
+    df_web,
+    test=False,
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    multi_phase_proned_thresh=load_config()["machine_learning"][
+        "prboability_thresholds"
+    ]["multi_phase"],
+    version="status_quo",
+):
+    """Runs all scored potential matches through the model in one batch, then logs and
+    communicates results project by project.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): wrangled company projects.
+     - `scored` (list of scorer.ScoredPairs): output of `score_candidates` for
+     `company_projects`, ordered by project.
+     - `df_web` (pd.DataFrame): wrangled certificates `scored` refers to.
+     - `test` (bool): whether in testing or not, will mute emails appropriately.
+     - `prob_thresh`, `multi_phase_proned_thresh`, `version`: see `match`.
+
+    Returns:
+     - a Pandas DataFrame of all scored and predicted potential matches, sorted by
+     probability within each project.
+     - number of projects for which a match was communicated.
+
+    """
+    pairs = concat_scored_pairs(scored)
+    predictions = predict_batch(
+        pairs,
+        df_web,
+        prob_thresh=prob_thresh,
+        multi_phase_proned_thresh=multi_phase_proned_thresh,
+        version=version,
+    )
+    results_master = expand_predictions(pairs, predictions, company_projects, df_web)
+    project_offsets = np.searchsorted(
+        pairs.project_pos, np.arange(len(company_projects) + 1)
+    )
+    comm_count = 0
+    all_results = []
+    for (_, company_project_row), start, end in zip(
+        company_projects.iterrows(), project_offsets[:-1], project_offsets[1:]
+    ):
+        results = results_master.iloc[start:end]
+        results = results.sort_values("pred_prob", ascending=False)
+        logger.info(
+            f"top 5 probabilities for project #{company_project_row['job_number']}: "
+            f"{', '. join([str(round(x, 5)) for x in results.head(5).pred_prob])}"
+        )
+        matches = results[results.pred_match == 1]
+        if len(matches) > 0:
+            logger.info(
+                f"found {len(matches)} match{'' if len(matches)==1 else 'es'}! with "
+                f"probability as high as {matches.iloc[0].pred_prob}"
+            )
+            if not test:
+                logger.info("getting ready to send notification...")
+                communicate(
+                    matches.drop(matches.index[1:]),  # sending only top result for now
+                    company_project_row,
+                    test=test,
+                )
+                comm_count += 1
+        else:
+            logger.info("didn't find any matches")
+        all_results.append(results)
+    logger.info(
+        f"Done looping through {len(company_projects)} open projects. Sent {comm_count} "
+        f"e-mails to communicate matches as a result."
+    )
+    return pd.concat(all_results), comm_count
+
+
+def parse_timeframe(since, until):
+    """Converts `since` and `until` parameters of `match` into actual dates (or datetime)
+    that can be used for querying `web_certificates` table."""
+    if since == "today":
+        since = datetime.datetime.now().date()
+    elif since == "day_ago":
+        since = (datetime.datetime.now() - datetime.timedelta(1)).date()
+    elif since == "week_ago":
+        since = (datetime.datetime.now() - datetime.timedelta(7)).date()
+    else:
+        try:
+            since = re.findall("\d{4}-\d{2}-\d{2}", since)[0]
+        except KeyError:
+            raise ValueError(
+                "`since` parameter should be in the format yyyy-mm-dd if not a key_word"
+            )
+    if until == "now":
+        until = datetime.datetime.now()
+    else:
+        try:
+            until = re.findall("\d{4}-\d{2}-\d{2}", until)[0]
+        except KeyError:
+            raise ValueError(
+                "`until` parameter should be in the format yyyy-mm-dd if not a key_word"
+            )
+    return since, until
+
+
+def get_cert_id_checks(company_projects, df_web):
+    """Returns new `last_cert_id_check` of every company project which has now been checked
+    against certificates above its previous one, keyed by `project_id`."""
+    if "project_id" not in company_projects.columns or not len(df_web):
+        return {}
+    last_cert_id = pd.to_numeric(df_web.cert_id).max()
+    prev_checks = pd.to_numeric(
+        company_projects.get(
+            "last_cert_id_check", pd.Series(np.nan, index=company_projects.index)
+        ),
+        errors="coerce",
+    )
+    fresh = company_projects[~(prev_checks >= last_cert_id)]
+    return {project_id: last_cert_id for project_id in fresh.project_id}
+
+
+def load_prefilter_thresh():
+    """Returns threshold of the first stage of the matching cascade last recorded by
+    `ml.calibrate_prefilter`, or `None` if there is none or if it was calibrated with
+    another `prefilter_version`, for which its 100% recall doesn't hold anymore."""
+    calibration = load_latest_recorded("prefilter calibration") or {}
+    if calibration.get("version") != prefilter_version:
+        return None
+    return calibration["threshold"]
+
+
 def match(
     company_projects=False,
     df_web=False,
@@ -134,6 +778,11 @@ def match(
         "prboability_thresholds"
     ]["multi_phase"],
     version="status_quo",
+    blocking=False,
+    workers=1,
+    incremental=False,
+    persist=False,
+    cascade=False,
 ):
     """Combines company projects and web CSP certificates in all-to-all join, wrangles the
     rows, scores the rows as potential matches, runs each row through Random Forest model,
@@ -164,11 +813,26 @@ def match(
      prob_thresh. This value should be set higher than prob_thresh.
      - `version` (str): default is `status_quo` but `new` can also be used for validating
      newly-trained models.
+     - `blocking` (bool): whether or not to only score certificates located within
+     `blocking_radius_km` (see config file) of each project, using `blocker.GeoGridIndex`.
+     Certificates or projects without any coordinates are never blocked.
+     - `workers` (int): number of processes to spread scoring of projects across. Results
+     are identical regardless of this setting.
+     - `incremental` (bool): whether or not to only score certificates above each project's
+     `last_cert_id_check`, skipping pairs scored in previous runs. Regardless of this
+     setting, `last_cert_id_check` of all projects gets updated in one go at the end of
+     non-test runs.
+     - `persist` (bool): whether or not to save features and predictions of every scored
+     pair to `match_scores` table (see `persist_match_scores`).
+     - `cascade` (bool): whether or not to only run full feature extraction and the model
+     on certificates passing a cheap first stage (see `scorer.prefilter_score`), using the
+     threshold last calibrated by `ml.calibrate_prefilter`, as long as it was calibrated
+     with the current `prefilter_version`.
 
     Returns:
      - a Pandas DataFrame containing all of certificate info, project number it was attempted
      to be matched with, and score results. Length of dataframe should be the length of
-     `company_projects` x `df_web`. Mostly used for testing purposes.
+     `company_projects` x `df_web` (less any blocked pairs). Mostly used for testing purposes.
      - `False` if there were no CSP certificates available for timeframe specified through
      `since` and `until`.
 
@@ -180,28 +844,7 @@ def match(
             company_projects = pd.read_sql(open_query, conn)
     company_projects = wrangle(company_projects)
     if not isinstance(df_web, pd.DataFrame):  # df_web == False
-        if since == "today":
-            since = datetime.datetime.now().date()
-        elif since == "day_ago":
-            since = (datetime.datetime.now() - datetime.timedelta(1)).date()
-        elif since == "week_ago":
-            since = (datetime.datetime.now() - datetime.timedelta(7)).date()
-        else:
-            try:
-                since = re.findall("\d{4}-\d{2}-\d{2}", since)[0]
-            except KeyError:
-                raise ValueError(
-                    "`since` parameter should be in the format yyyy-mm-dd if not a key_word"
-                )
-        if until == "now":
-            until = datetime.datetime.now()
-        else:
-            try:
-                until = re.findall("\d{4}-\d{2}-\d{2}", until)[0]
-            except KeyError:
-                raise ValueError(
-                    "`until` parameter should be in the format yyyy-mm-dd if not a key_word"
-                )
+        since, until = parse_timeframe(since, until)
         hist_query = """
             SELECT * 
             FROM web_certificates
@@ -222,70 +865,346 @@ def match(
                 'noteworthy matches' : {}
             })
             return False
-    df_web = wrangle(df_web)
-    comm_count = 0
-    for _, company_project_row in company_projects.iterrows():
-        results = build_match_score(
-            company_project_row.to_frame().transpose(), df_web, fresh_cert_limit=(not test)
-        )  # .iterows returns a pd.Series for every row so this turns it back into a dataframe to avoid breaking any methods downstream
-        logger.info(
-            f"searching for potential match for project #{company_project_row['job_number']}..."
-        )
-        results["job_number"] = company_project_row.job_number
-        results["multi_phase_proned"] = results.apply(
-            lambda row: 1
-            if any(
-                re.findall(
-                    "campus|hospital|university|college",
-                    "".join(row[["city", "title"]].apply(str)),
-                )
+    df_web = wrangle(df_web).reset_index(drop=True)  # positions are used to refer to rows
+    blocking_radius_km = load_config()["matcher"]["blocking_radius_km"] if blocking else None
+    prefilter_thresh = None
+    if cascade:
+        prefilter_thresh = load_prefilter_thresh()
+        if prefilter_thresh is None:
+            logger.warning(
+                f"no prefilter threshold calibrated for prefilter version {prefilter_version}"
+                " - run `ml.calibrate_prefilter` first. Scoring all candidates instead."
             )
-            else 0,
-            axis=1,
-        )
-        results["pred_prob"] = results.apply(
-            lambda row: predict_prob(row, version=version), axis=1
+    features = list(load_feature_list(version))  # only what the model needs gets scored
+    if workers > 1:
+        scored = score_candidates_parallel(
+            company_projects,
+            df_web,
+            workers,
+            blocking_radius_km=blocking_radius_km,
+            incremental=incremental,
+            prefilter_thresh=prefilter_thresh,
+            features=features,
         )
-        results["pred_match"] = results.apply(
-            lambda row: predict_match(
-                row.pred_prob,
-                prob_thresh,
-                row.multi_phase_proned,
-                multi_phase_proned_thresh,
+    else:
+        geo_index = GeoGridIndex(df_web, blocking_radius_km) if blocking else None
+        scored = score_candidates(
+            company_projects,
+            get_candidates(
+                company_projects, df_web, geo_index, incremental, prefilter_thresh
             ),
-            axis=1,
+            features=features,
         )
-        results = results.sort_values("pred_prob", ascending=False)
+    results_master, comm_count = report_matches(
+        company_projects,
+        scored,
+        df_web,
+        test=test,
+        prob_thresh=prob_thresh,
+        multi_phase_proned_thresh=multi_phase_proned_thresh,
+        version=version,
+    )
+    if persist:
+        persist_match_scores(results_master, version=version)
+    if not test:
+        record_cert_id_checks(get_cert_id_checks(company_projects, df_web))
+    update_results({
+        'match summary': f"matched {comm_count} out of {len(company_projects)} projects and {len(df_web)} CSP's",
+        'noteworthy matches' : results_master[results_master.pred_prob > 0.5][['cert_id','job_number', 'pred_prob', 'pred_match']].to_dict()
+    })
+    return results_master
+
+
+def match_new_certs(
+    cert_ids,
+    company_projects=False,
+    test=False,
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    multi_phase_proned_thresh=load_config()["machine_learning"][
+        "prboability_thresholds"
+    ]["multi_phase"],
+    version="status_quo",
+    persist=False,
+):
+    """Certificate-triggered counterpart of `match`. Instead of scoring every open project
+    against every certificate, looks up which open projects share at least one wrangled
+    token (see `blocker.TokenIndex`) with each of the specified certificates and only scores
+    those (certificate, project) pairs. Meant for when a handful of new certificates come in.
+    Does not update `last_cert_id_check` of projects.
+
+    The token index is rebuilt from the open projects on every call rather than kept up to
+    date across calls, so that projects entered or closed in the meantime (through
+    `flask_app` or `communicator`, possibly in another process) are always accounted for.
+    Building it takes well under a second for a few thousand open projects.
+
+    Parameters:
+     - `cert_ids` (list of int): ids of certificates from `web_certificates` table to match.
+     - `company_projects` (pd.DataFrame): specify dataframe of company projects to match
+     instead of default, which is to retreive all open projects from `company_projects` table
+     in databse.
+     - `test`, `prob_thresh`, `multi_phase_proned_thresh`, `version`, `persist`: see
+     `match`.
+
+    Returns:
+     - a Pandas DataFrame containing all of the scored (certificate, project) pairs.
+     - `False` if none of the certificates shared any token with an open project, or if
+     `cert_ids` is empty.
+
+    """
+    if not len(cert_ids):
+        logger.info("no new certificates to match.")
+        return False
+    logger.info(f"matching {len(cert_ids)} new certificates...")
+    if not isinstance(company_projects, pd.DataFrame):  # company_projects == False
+        open_query = "SELECT * FROM company_projects WHERE closed=0"
+        with create_connection() as conn:
+            company_projects = pd.read_sql(open_query, conn)
+    cert_query = f"""
+        SELECT *
+        FROM web_certificates
+        WHERE cert_id IN ({','.join(['%s']*len(cert_ids))})
+        ORDER BY cert_id
+    """
+    with create_connection() as conn:
+        df_web = pd.read_sql(cert_query, conn, params=[int(x) for x in cert_ids])
+    company_projects = wrangle(company_projects).reset_index(drop=True)
+    df_web = wrangle(df_web).reset_index(drop=True)
+    token_index = TokenIndex(company_projects)
+    cert_positions = {}  # project position -> positions of candidate certificates
+    for cert_pos, (_, web_row) in enumerate(df_web.iterrows()):
+        for project_pos in token_index.query(web_row):
+            cert_positions.setdefault(project_pos, []).append(cert_pos)
+    n_pairs = sum(len(x) for x in cert_positions.values())
+    logger.info(
+        f"token index narrowed down {len(df_web) * len(company_projects)} possible pairs "
+        f"to {n_pairs} candidate pairs."
+    )
+    if not n_pairs:
+        update_results({
+            'match summary': 'no open project shares tokens with new certificates',
+            'noteworthy matches' : {}
+        })
+        return False
+    project_positions = sorted(cert_positions)
+    company_projects = company_projects.iloc[project_positions]
+    candidates = (df_web.iloc[cert_positions[pos]].copy() for pos in project_positions)
+    scored = score_candidates(
+        company_projects, candidates, features=list(load_feature_list(version))
+    )
+    results_master, comm_count = report_matches(
+        company_projects,
+        scored,
+        df_web,
+        test=test,
+        prob_thresh=prob_thresh,
+        multi_phase_proned_thresh=multi_phase_proned_thresh,
+        version=version,
+    )
+    if persist:
+        persist_match_scores(results_master, version=version)
+    update_results({
+        'match summary': f"matched {comm_count} out of {len(company_projects)} candidate projects and {len(df_web)} new CSP's",
+        'noteworthy matches' : results_master[results_master.pred_prob > 0.5][['cert_id','job_number', 'pred_prob', 'pred_match']].to_dict()
+    })
+    return results_master
+
+
+def read_cert_chunks(since, until, chunk_size):
+    """Yields raw certificates published within timeframe, `chunk_size` at a time. Pages
+    through `web_certificates` by `cert_id` so that only one chunk is ever held in memory
+    and every page is a cheap index range scan, however far back `since` goes."""
+    chunk_query = """
+        SELECT *
+        FROM web_certificates
+        WHERE pub_date>=%s AND pub_date<=%s AND cert_id>%s
+        ORDER BY cert_id
+        LIMIT %s
+    """
+    last_cert_id = -1
+    while True:
+        with create_connection() as conn:
+            chunk = pd.read_sql(
+                chunk_query, conn, params=[since, until, last_cert_id, chunk_size]
+            )
+        if not len(chunk):
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_cert_id = int(chunk.cert_id.max())
+
+
+def stream_match(
+    company_projects,
+    since="today",
+    until="now",
+    chunk_size=load_config()["matcher"]["stream_chunk_size"],
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    multi_phase_proned_thresh=load_config()["machine_learning"][
+        "prboability_thresholds"
+    ]["multi_phase"],
+    version="status_quo",
+    blocking=False,
+):
+    """Scores wrangled company projects against certificates of specified timeframe one
+    chunk of certificates at a time.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): wrangled company projects to match.
+     - `chunk_size` (int): number of certificates to read, wrangle and score at once.
+     - `since`, `until`, `prob_thresh`, `multi_phase_proned_thresh`, `version`, `blocking`:
+     see `match`.
+
+    Yields:
+     - wrangled chunk of certificates, along with `scorer.ScoredPairs` of that chunk
+     (ordered by project) and their predictions (see `predict_batch`).
+
+    """
+    since, until = parse_timeframe(since, until)
+    features = list(load_feature_list(version))
+    for chunk_no, df_web in enumerate(read_cert_chunks(since, until, chunk_size)):
         logger.info(
-            f"top 5 probabilities for project #{company_project_row['job_number']}: "
-            f"{', '. join([str(round(x, 5)) for x in results.head(5).pred_prob])}"
+            f"scoring chunk #{chunk_no + 1} ({len(df_web)} CSP's starting from cert_id "
+            f"{df_web.cert_id.min()})..."
         )
-        matches = results[results.pred_match == 1]
-        if len(matches) > 0:
-            logger.info(
-                f"found {len(matches)} match{'' if len(matches)==1 else 'es'}! with "
-                f"probability as high as {matches.iloc[0].pred_prob}"
-            )
-            if not test:
-                logger.info("getting ready to send notification...")
-                communicate(
-                    matches.drop(matches.index[1:]),  # sending only top result for now
-                    company_project_row,
-                    test=test,
+        df_web = wrangle(df_web).reset_index(drop=True)
+        geo_index = (
+            GeoGridIndex(df_web, load_config()["matcher"]["blocking_radius_km"])
+            if blocking
+            else None
+        )
+        scored = score_candidates(
+            company_projects,
+            get_candidates(company_projects, df_web, geo_index),
+            features=features,
+        )
+        pairs = concat_scored_pairs(scored, features)
+        predictions = predict_batch(
+            pairs,
+            df_web,
+            prob_thresh=prob_thresh,
+            multi_phase_proned_thresh=multi_phase_proned_thresh,
+            version=version,
+        )
+        yield df_web, pairs, predictions
+
+
+def match_streaming(
+    company_projects=False,
+    test=False,
+    since="today",
+    until="now",
+    chunk_size=load_config()["matcher"]["stream_chunk_size"],
+    top_k=load_config()["matcher"]["stream_top_k"],
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    multi_phase_proned_thresh=load_config()["machine_learning"][
+        "prboability_thresholds"
+    ]["multi_phase"],
+    version="status_quo",
+    blocking=False,
+    persist=False,
+):
+    """Memory-bounded counterpart of `match` for long timeframes (e.g. historical
+    back-matching over several years). Certificates are streamed through `stream_match`
+    chunk by chunk, and only the `top_k` most probable matches of each project are kept
+    along the way, in a min-heap. Memory usage therefore depends on `chunk_size` and
+    `top_k` but not on the size of the timeframe. With `persist`, all scored pairs of each
+    chunk get saved to `match_scores` as the stream goes.
+
+    Parameters:
+     - `chunk_size` (int): number of certificates to read, wrangle and score at once.
+     - `top_k` (int): number of most probable potential matches to keep for each project.
+     - `company_projects`, `test`, `since`, `until`, `prob_thresh`,
+     `multi_phase_proned_thresh`, `version`, `blocking`, `persist`: see `match`.
+
+    Returns:
+     - a Pandas DataFrame containing up to `top_k` potential matches for each project,
+     sorted by probability within each project.
+     - `False` if there were no CSP certificates available for timeframe specified.
+
+    """
+    logger.info("matching in streaming mode...")
+    if not isinstance(company_projects, pd.DataFrame):  # company_projects == False
+        open_query = "SELECT * FROM company_projects WHERE closed=0"
+        with create_connection() as conn:
+            company_projects = pd.read_sql(open_query, conn)
+    company_projects = wrangle(company_projects)
+    heaps = [[] for _ in range(len(company_projects))]
+    tie_breaker = itertools.count()  # rows themselves can't be compared on equal probability
+    n_certs, last_cert_id, feature_names = 0, None, None
+    for df_web, pairs, predictions in stream_match(
+        company_projects,
+        since=since,
+        until=until,
+        chunk_size=chunk_size,
+        prob_thresh=prob_thresh,
+        multi_phase_proned_thresh=multi_phase_proned_thresh,
+        version=version,
+        blocking=blocking,
+    ):
+        probs = predictions.pred_prob.values
+        project_offsets = np.searchsorted(
+            pairs.project_pos, np.arange(len(company_projects) + 1)
+        )
+        for heap, start, end in zip(heaps, project_offsets[:-1], project_offsets[1:]):
+            top_pairs = start + np.argsort(-probs[start:end], kind="stable")[:top_k]
+            for pair in top_pairs:
+                item = (
+                    probs[pair],
+                    next(tie_breaker),
+                    pairs.features[pair],
+                    df_web.iloc[pairs.cert_pos[pair]],
                 )
-                comm_count += 1
-        else:
-            logger.info("didn't find any matches")
-        try:
-            results_master = results_master.append(results)
-        except NameError:
-            results_master = results
-    logger.info(
-        f"Done looping through {len(company_projects)} open projects. Sent {comm_count} "
-        f"e-mails to communicate matches as a result."
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item[0] > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+        if persist:
+            persist_match_scores(
+                expand_predictions(pairs, predictions, company_projects, df_web),
+                version=version,
+            )
+        feature_names = pairs.feature_names
+        n_certs += len(df_web)
+        last_cert_id = df_web.cert_id.max()  # chunks come in ascending order of cert_id
+    if not n_certs:
+        logger.info("No CSP's to match within timeframe. Breaking out of match function.")
+        update_results({
+            'match summary': 'nothing new to match',
+            'noteworthy matches' : {}
+        })
+        return False
+    kept = [
+        (project_pos, features, cert_row)
+        for project_pos, heap in enumerate(heaps)
+        for _, _, features, cert_row in sorted(heap, reverse=True)
+    ]  # predictions get recomputed for these few pairs, which is cheap and deterministic
+    kept_web_df = pd.DataFrame([cert_row for _, _, cert_row in kept]).reset_index(drop=True)
+    scored = [
+        ScoredPairs(
+            np.array([features for _, features, _ in kept], dtype=np.float32).reshape(
+                len(kept), len(feature_names)
+            ),
+            feature_names,
+            np.array([project_pos for project_pos, _, _ in kept], dtype=np.int32),
+            np.arange(len(kept), dtype=np.int32),
+        )
+    ]
+    results_master, comm_count = report_matches(
+        company_projects,
+        scored,
+        kept_web_df,
+        test=test,
+        prob_thresh=prob_thresh,
+        multi_phase_proned_thresh=multi_phase_proned_thresh,
+        version=version,
     )
+    if not test:
+        record_cert_id_checks(
+            get_cert_id_checks(company_projects, pd.DataFrame({"cert_id": [last_cert_id]}))
+        )
     update_results({
-        'match summary': f"matched {comm_count} out of {len(company_projects)} projects and {int(len(results_master)/len(company_projects))} CSP's",
+        'match summary': f"matched {comm_count} out of {len(company_projects)} projects and {n_certs} CSP's (streaming)",
         'noteworthy matches' : results_master[results_master.pred_prob > 0.5][['cert_id','job_number', 'pred_prob', 'pred_match']].to_dict()
     })
     return results_master
@@ -299,10 +1218,85 @@ if __name__ == "__main__":
     parser.add_argument(
         "--until", type=str, help="date for when to stop search for matches"
     )
+    parser.add_argument(
+        "--cert_ids",
+        type=int,
+        nargs="+",
+        help="only match specified new certificates against open projects",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of processes to spread scoring across",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip certificates already checked against each project in previous runs",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="stream certificates this many at a time, keeping only top matches in memory",
+    )
+    parser.add_argument(
+        "--top_k",
+        type=int,
+        help="number of potential matches to keep for each project when streaming",
+    )
+    parser.add_argument(
+        "--persist",
+        action="store_true",
+        help="save features and predictions of every scored pair to `match_scores` table",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="only fully score certificates passing a cheap calibrated prefilter",
+    )
+    parser.add_argument(
+        "--blocking",
+        action="store_true",
+        help="only score certificates located near each project",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record time spent on each wrangling op and feature, as well as cleaning cache "
+        "hit rates, saved to results.json",
+    )
     args = parser.parse_args()
+    if args.profile:
+        enable_profiling()
     kwargs = {}
     if args.since:
         kwargs["since"] = args.since
     if args.since:
         kwargs["until"] = args.until
-    match(**kwargs)
+    if args.blocking:
+        kwargs["blocking"] = True
+    if args.workers:
+        kwargs["workers"] = args.workers
+    if args.incremental:
+        kwargs["incremental"] = True
+    if args.persist:
+        kwargs["persist"] = True
+    if args.cascade:
+        kwargs["cascade"] = True
+    if args.cert_ids:
+        match_new_certs(args.cert_ids, persist=args.persist)
+    elif args.chunk_size or args.top_k:
+        for unsupported_kwarg in ("workers", "incremental", "cascade"):
+            kwargs.pop(unsupported_kwarg, None)
+        if args.chunk_size:
+            kwargs["chunk_size"] = args.chunk_size
+        if args.top_k:
+            kwargs["top_k"] = args.top_k
+        match_streaming(**kwargs)
+    else:
+        match(**kwargs)
+    if args.profile:
+        record_profile_stats()
+        for func_name, cache_stats in clean_cache_info().items():
+            logger.info(f"{func_name} cache: {cache_stats}")
+        update_results({"clean_cache": clean_cache_info()})
@@ -6,10 +6,20 @@ from sklearn.ensemble import RandomForestClassifier
 from imblearn.over_sampling import SMOTE
 from sklearn.model_selection import KFold
 from sklearn.metrics import f1_score
+from sklearn.neighbors import NearestNeighbors
+from joblib import Parallel, delayed, effective_n_jobs
 import pickle
-from wrangler import wrangle
-from matcher import match
-from scorer import build_match_score
+import joblib
+from wrangler import wrangle, wrangle_rows, wrangler_version
+from matcher import match, prefilter_version
+from forest import flatten_forest
+from scorer import (
+    score_cross_pairs,
+    prefilter_score,
+    feature_registry,
+    get_required_features,
+    scorer_version,
+)
 from utils import create_connection, load_config, update_results
 import sys
 import logging
@@ -39,11 +49,28 @@ try:
 except FileNotFoundError:  # no `.secret.json` file if running in CI
     pass
 
+model_artifacts = ["model", "features", "forest"]
+
+
 def save_model(model):
-    """Pickles current machine learning model nd saves it to the project's root directory."""
+    """Pickles current machine learning model nd saves it to the project's root directory,
+    along with its flattened trees (see `forest.flatten_forest`), which are dumped
+    uncompressed by joblib so that they can be memory-mapped on load."""
     logger.debug("saving random forest classifier")
     with open("./new_rf_model.pkl", "wb") as output:
         pickle.dump(model, output)
+    joblib.dump(flatten_forest(model), "./new_rf_forest.pkl")
+
+
+def rename_artifacts(src_pattern, dst_pattern):
+    """Renames every artifact of a model (see `model_artifacts`) from `src_pattern` to
+    `dst_pattern`, both of which get formatted with the artifact name. Models saved before
+    `forest` artifacts existed don't have one, which is fine."""
+    for artifact in model_artifacts:
+        src = src_pattern.format(artifact=artifact)
+        if artifact == "forest" and not os.path.exists(src):
+            continue
+        os.rename(src, dst_pattern.format(artifact=artifact))
 
 
 def save_feature_list(columns):
@@ -54,13 +81,132 @@ def save_feature_list(columns):
         pickle.dump(columns, output)
 
 
-def build_train_set():
+train_feature_names = list(feature_registry)  # all of them, whichever ones get trained on
+train_feature_version = f"{wrangler_version}.{scorer_version}"
+
+
+def create_train_features_table():
+    """Creates `train_features` table, which holds features of every (project, certificate)
+    pair ever used for training, if it doesn't exist yet. Also adds columns of features
+    that were registered since."""
+    create_query = f"""
+        CREATE TABLE IF NOT EXISTS train_features (
+            project_id INTEGER,
+            cert_id INTEGER,
+            feature_version VARCHAR(32),
+            title_length DOUBLE,
+            {', '.join(f'{col} DOUBLE' for col in train_feature_names)},
+            PRIMARY KEY (project_id, cert_id, feature_version)
+        )
+    """
+    with create_connection() as conn:
+        conn.cursor().execute(create_query)
+        existing_cols = set(pd.read_sql("SHOW COLUMNS FROM train_features", conn).Field)
+        missing_cols = [col for col in train_feature_names if col not in existing_cols]
+        if missing_cols:
+            conn.cursor().execute(
+                "ALTER TABLE train_features "
+                + ", ".join(f"ADD COLUMN {col} DOUBLE" for col in missing_cols)
+            )
+        conn.commit()
+
+
+def load_train_features():
+    """Returns stored features of the current `train_feature_version` from `train_features`
+    table."""
+    create_train_features_table()
+    with create_connection() as conn:
+        return pd.read_sql(
+            "SELECT * FROM train_features WHERE feature_version=%s",
+            conn,
+            params=[train_feature_version],
+        )
+
+
+def persist_train_features(train_features, batch_size=1000):
+    """Saves features of newly scored pairs (see `score_train_pairs`) to `train_features`
+    table under the current `train_feature_version`, using batched `executemany` inserts."""
+    if not len(train_features):
+        return
+    create_train_features_table()
+    rows = train_features.assign(feature_version=train_feature_version)
+    rows = rows.astype(object).where(rows.notnull(), None)  # numpy types and nan to python
+    insert_query = f"""
+        INSERT INTO train_features ({', '.join(rows.columns)})
+        VALUES ({', '.join(['%s'] * len(rows.columns))})
+    """
+    values = rows.values.tolist()
+    with create_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(values), batch_size):
+            cursor.executemany(insert_query, values[start:start + batch_size])
+        conn.commit()
+    logger.info(f"persisted features of {len(values)} pairs to `train_features`")
+
+
+def clear_train_features(stale_only=False):
+    """Deletes stored features from `train_features` table, either all of them or only the
+    ones of outdated feature versions."""
+    create_train_features_table()
+    delete_query = "DELETE FROM train_features" + (
+        " WHERE feature_version<>%s" if stale_only else ""
+    )
+    with create_connection() as conn:
+        conn.cursor().execute(delete_query, [train_feature_version] if stale_only else [])
+        conn.commit()
+
+
+def score_train_pairs(company_projects, web_df, project_pos, cert_pos):
+    """Computes every feature of `feature_registry`, along with certificate `title_length`,
+    for given (company project, certificate) pairs. Only involved rows get wrangled, each
+    as if on its own (see `wrangler.wrangle_rows`) so that features of a pair don't depend
+    on which other pairs get scored with it, and all pairs get scored in one
+    `score_cross_pairs` pass.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): raw company projects, with `project_id`.
+     - `web_df` (pd.DataFrame): raw certificates, with `cert_id`.
+     - `project_pos` (np.array): positions of pairs' projects within `company_projects`.
+     - `cert_pos` (np.array): positions of pairs' certificates within `web_df`.
+
+    Returns:
+     - a Pandas DataFrame with `project_id`, `cert_id`, `title_length` and features of each
+     pair, in the order of input pairs.
+
+    """
+    unique_project_pos, project_inv = np.unique(project_pos, return_inverse=True)
+    unique_cert_pos, cert_inv = np.unique(cert_pos, return_inverse=True)
+    projects = wrangle_rows(company_projects.iloc[unique_project_pos])
+    certs = wrangle_rows(web_df.iloc[unique_cert_pos])
+    scored = score_cross_pairs(projects, certs, features=train_feature_names)
+    train_features = pd.DataFrame(
+        scored.features[project_inv * len(unique_cert_pos) + cert_inv],
+        columns=scored.feature_names,
+    )
+    train_features.insert(0, "title_length", certs.title.str.len().values[cert_inv])
+    train_features.insert(0, "cert_id", certs.cert_id.values[cert_inv])
+    train_features.insert(0, "project_id", projects.project_id.values[project_inv])
+    return train_features
+
+
+def build_train_set(
+    incremental=load_config()["machine_learning"]["incremental_train_set"]
+):
     """Builds training dataset by extracting relevant rows from `web_certificates` and 
     `company_projects` tables within cert_db databse, wrangling the data, and combining
-    it in various ways. Saves to project root directory as Pandas Dataframe."""
+    it in various ways. Saves to project root directory as Pandas Dataframe.
+
+    Parameters:
+     - `incremental` (bool): whether to only score (project, certificate) pairs that aren't
+     in `train_features` table yet and reuse stored features of the other ones. Otherwise,
+     or whenever the wrangler or scorer version changed (see `train_feature_version`),
+     every pair gets scored again and stored features start over.
+
+    """
     logger.info("building dataset for training random forest classifier")
     match_query = """
         SELECT
+            company_projects.project_id,
             company_projects.job_number,
             company_projects.city,
             company_projects.address,
@@ -125,7 +271,6 @@ def build_train_set():
     with create_connection() as conn:
         test_company_projects = pd.read_sql(match_query, conn)
         test_web_df = pd.read_sql(corr_web_certs_query, conn)
-    test_web_df = wrangle(test_web_df)
 
     # Get some certificates that are definitely not matches to provide some false matches to train from
     start_date = "2011-01-01"
@@ -133,30 +278,133 @@ def build_train_set():
     hist_query = "SELECT * FROM web_certificates WHERE pub_date BETWEEN %s AND %s ORDER BY pub_date"
     with create_connection() as conn:
         rand_web_df = pd.read_sql(hist_query, conn, params=[start_date, end_date])
-    rand_web_df = wrangle(rand_web_df)
-
-    for i, test_company_row in test_company_projects.iterrows():
-        test_company_row = wrangle(
-            test_company_row.to_frame().transpose()
-        )  # .iterows returns a pd.Series for every row so this turns it back into a dataframe to avoid breaking any methods downstream
-        rand_web_df = rand_web_df.sample(n=len(test_company_projects), random_state=i)
-        close_matches = build_match_score(test_company_row, test_web_df, fresh_cert_limit=False)
-        random_matches = build_match_score(test_company_row, rand_web_df, fresh_cert_limit=False)
-        matches = close_matches.append(random_matches)
-        matches["ground_truth"] = matches.url_key.apply(
-            lambda x: 1 if x == test_company_row.url_key.iloc[0] else 0
+
+    # certificates get pooled into one table so that pairs can refer to them by position -
+    # close matches come first, followed by random ones
+    test_web_df = test_web_df.reset_index(drop=True)
+    rand_web_df = rand_web_df.reset_index(drop=True)
+    web_df = pd.concat([test_web_df, rand_web_df], ignore_index=True)
+    company_projects = test_company_projects.reset_index(drop=True)
+
+    # each company project gets paired with every close match and with its own sample of
+    # random certificates, each sample being drawn out of the previous one
+    sample = rand_web_df.index.to_series()
+    rand_pos = []
+    for i in range(len(company_projects)):
+        sample = sample.sample(n=len(company_projects), random_state=i)
+        rand_pos.append(len(test_web_df) + sample.index.values)
+    cert_pos = np.hstack(
+        [
+            np.tile(np.arange(len(test_web_df)), (len(company_projects), 1)),
+            np.array(rand_pos, dtype=int).reshape(len(company_projects), len(company_projects)),
+        ]
+    )  # one row of pooled certificate positions per company project
+    pairs = pd.DataFrame(
+        {
+            "project_pos": np.repeat(np.arange(len(company_projects)), cert_pos.shape[1]),
+            "cert_pos": cert_pos.ravel(),
+        }
+    )
+    pairs["project_id"] = company_projects.project_id.values[pairs.project_pos]
+    pairs["cert_id"] = web_df.cert_id.values[pairs.cert_pos]
+
+    # only pairs that were never scored by current wrangler and scorer versions get scored
+    train_features = load_train_features() if incremental else pd.DataFrame()
+    if not len(train_features):
+        logger.info("scoring all training pairs from scratch")
+        clear_train_features(stale_only=incremental)
+        train_features = pd.DataFrame(columns=["project_id", "cert_id"])
+    unique_pairs = pairs.drop_duplicates(["project_id", "cert_id"])
+    pair_keys = pd.MultiIndex.from_arrays([unique_pairs.project_id, unique_pairs.cert_id])
+    stored_keys = pd.MultiIndex.from_arrays([train_features.project_id, train_features.cert_id])
+    missing_pairs = unique_pairs[~pair_keys.isin(stored_keys)]
+    is_new_project = ~missing_pairs.project_id.isin(train_features.project_id).values
+    new_train_features = [
+        score_train_pairs(
+            company_projects,
+            web_df,
+            missing_pairs.project_pos.values[block],
+            missing_pairs.cert_pos.values[block],
+        )
+        for block in [is_new_project, ~is_new_project]  # new projects, then new certificates
+        if block.any()
+    ]
+    if new_train_features:
+        new_train_features = pd.concat(new_train_features, ignore_index=True)
+        persist_train_features(new_train_features)
+        train_features = pd.concat(
+            [train_features, new_train_features], ignore_index=True, sort=False
         )
-        matches["title_length"] = matches.title.apply(len)
-        try:
-            all_matches = all_matches.append(matches)
-        except NameError:
-            all_matches = matches
-    all_matches.to_csv("./train_set.csv", index=False)
+    logger.info(f"scored {len(missing_pairs)} new training pairs out of {len(unique_pairs)}")
+
+    features = get_required_features(None, load_config()["scorer"]["great_circle_distance"])
+    pair_features = pairs.merge(train_features, how="left", on=["project_id", "cert_id"])
+    train_set = pair_features[features].astype(np.float32)
+    train_set["job_number"] = company_projects.job_number.values[pairs.project_pos]
+    train_set["url_key"] = web_df.url_key.values[pairs.cert_pos]
+    train_set["ground_truth"] = (
+        train_set.url_key.values == company_projects.url_key.values[pairs.project_pos]
+    ).astype(int)
+    train_set["title_length"] = pair_features.title_length.values
+    train_set.to_pickle("./train_set.pkl")
+
+
+def fit_fold(
+    clf, sm, X, y, train_index, test_index, prob_thresh, use_smote, split_no, n_jobs=None
+):
+    """Fits `clf` on one K-Split of the training set, optionally resampled with `sm`, and
+    evaluates it on the rest. Lives at module level so that `train_model` can run K-Splits
+    in worker processes. `n_jobs` cores are used for fitting only, since summing up
+    probabilities of trees concurrently doesn't always add them up in the same order.
+
+    Returns:
+     - rc (float): recall
+     - pr (float): precision
+     - f1 (float): f1 score
+    """
+    logger.info(f"K-Split #{split_no}...")
+    X_train, X_test = X.values[train_index], X.values[test_index]
+    y_train, y_test = y.values[train_index], y.values[test_index]
+    if use_smote:
+        X_train_final, y_train_final = sm.fit_sample(X_train, y_train)
+    else:
+        X_train_final, y_train_final = X_train, y_train
+    clf.set_params(n_jobs=n_jobs).fit(X_train_final, y_train_final)
+    clf.set_params(n_jobs=None)
+    prob = clf.predict_proba(X_test)
+    pred = [1 if x >= prob_thresh else 0 for x in clf.predict_proba(X_test)[:, 1]]
+    y_test = y_test.reshape(
+        y_test.shape[0]
+    )  # shitty little workaround required due to pandas -> numpy  conversion
+    results = pd.DataFrame(
+        {
+            "truth": y_test,
+            "total_score": X_test[:, -1],
+            "prob": prob[:, 1],
+            "pred": pred,
+        }
+    )
+    rc = len(results[(results.truth == 1) & (results.pred == 1)]) / len(
+        results[results.truth == 1]
+    )
+    pr = len(results[(results.truth == 1) & (results.pred == 1)]) / len(
+        results[results.pred == 1]
+    )
+    f1 = f1_score(y_test, pred)
+    logger.debug(
+        f"number of truthes to learn from: {len([x for x in y_train if x==1])} out of {len(y_train)}"
+    )
+    logger.debug(f"number of tests: {len(results[results.truth==1])}")
+    logger.debug(f"recall: {round(rc, 3)}")
+    logger.debug(f"precision: {round(pr, 3)}")
+    logger.debug(f"f1 score: {round(f1, 3)}")
+    return rc, pr, f1
 
 
 def train_model(
     prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
-    use_smote=load_config()["machine_learning"]["use_smote"]
+    use_smote=load_config()["machine_learning"]["use_smote"],
+    n_jobs=load_config()["machine_learning"]["n_jobs"],
 ):
     """Trains instance of scikit-learn's RandomForestClassifier model on the training dataset
     from project's root directory (typically produced by function ml.build_train_set) and saves
@@ -169,6 +417,9 @@ def train_model(
      only its custom predictions and performance metrics. Default loads from config file.
      - `use_smote` (boolean): whether or not the SMOTE algorithm should be applied to the labeled
      data before training the model. Default loads from config file.
+     - `n_jobs` (int): number of cores used to fit K-Splits concurrently and to fit each
+     random forest and find SMOTE neighbours, or -1 for all of them. Results are the same as
+     with 1. Default loads from config file.
 
     Returns:
      - rc_cum (float): average recall
@@ -176,7 +427,7 @@ def train_model(
      - f1_cum (float): avergae f1 score
     """
     logger.info("training random forest classifier")
-    df = pd.read_csv("./train_set.csv")
+    df = pd.read_pickle("./train_set.pkl")
     exclude_fetures = load_config()["machine_learning"]["exclude_features"]
     X = df[[x for x in df.columns if x.endswith("_score") and x not in exclude_fetures]]
     save_feature_list(X.columns)
@@ -184,50 +435,29 @@ def train_model(
     update_results({'features' : feature_list})
     y = df[["ground_truth"]]
     clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    sm = SMOTE(random_state=42, sampling_strategy=1)
+    sm = SMOTE(
+        random_state=42,
+        sampling_strategy=1,
+        k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=n_jobs),  # SMOTE's default k of 5
+    )
     kf = KFold(n_splits=3, shuffle=True, random_state=41)
-    rc_cum, pr_cum, f1_cum = [], [], []
-    split_no = 0
-    for train_index, test_index in kf.split(X):
-        split_no += 1
-        logger.info(f"K-Split #{split_no}...")
-        X_train, X_test = X.values[train_index], X.values[test_index]
-        y_train, y_test = y.values[train_index], y.values[test_index]
-        if use_smote:
-            X_train_final, y_train_final = sm.fit_sample(X_train, y_train)
-        else:
-            X_train_final, y_train_final = X_train, y_train
-        clf.fit(X_train_final, y_train_final)
-        prob = clf.predict_proba(X_test)
-        pred = [1 if x >= prob_thresh else 0 for x in clf.predict_proba(X_test)[:, 1]]
-        y_test = y_test.reshape(
-            y_test.shape[0]
-        )  # shitty little workaround required due to pandas -> numpy  conversion
-        results = pd.DataFrame(
-            {
-                "truth": y_test,
-                "total_score": X_test[:, -1],
-                "prob": prob[:, 1],
-                "pred": pred,
-            }
-        )
-        rc = len(results[(results.truth == 1) & (results.pred == 1)]) / len(
-            results[results.truth == 1]
+    fold_jobs = min(kf.get_n_splits(), effective_n_jobs(n_jobs))
+    fold_scores = Parallel(n_jobs=fold_jobs)(
+        delayed(fit_fold)(
+            clf,
+            sm,
+            X,
+            y,
+            train_index,
+            test_index,
+            prob_thresh,
+            use_smote,
+            split_no,
+            n_jobs=max(1, effective_n_jobs(n_jobs) // fold_jobs),
         )
-        pr = len(results[(results.truth == 1) & (results.pred == 1)]) / len(
-            results[results.pred == 1]
-        )
-        f1 = f1_score(y_test, pred)
-        logger.debug(
-            f"number of truthes to learn from: {len([x for x in y_train if x==1])} out of {len(y_train)}"
-        )
-        logger.debug(f"number of tests: {len(results[results.truth==1])}")
-        logger.debug(f"recall: {round(rc, 3)}")
-        logger.debug(f"precision: {round(pr, 3)}")
-        logger.debug(f"f1 score: {round(f1, 3)}")
-        rc_cum.append(rc)
-        pr_cum.append(pr)
-        f1_cum.append(f1)
+        for split_no, (train_index, test_index) in enumerate(kf.split(X), start=1)
+    )  # K-Splits are seeded, so they give the same results whichever order they run in
+    rc_cum, pr_cum, f1_cum = (list(x) for x in zip(*fold_scores))
     logger.debug(f"average recall: {round(sum(rc_cum)/len(rc_cum), 3)}")
     logger.debug(f"average precision: {round(sum(pr_cum)/len(pr_cum), 3)}")
     logger.debug(f"avergae f1 score: {round(sum(f1_cum)/len(f1_cum), 3)}")
@@ -235,7 +465,8 @@ def train_model(
         X_final, y_final = sm.fit_sample(X, y)
     else:
         X_final, y_final = X, y 
-    clf.fit(X_final, y_final)
+    clf.set_params(n_jobs=n_jobs).fit(X_final, y_final)
+    clf.set_params(n_jobs=None)  # saved model predicts serially, as it always has
     feat_imp = pd.DataFrame(
         {"feat": X.columns, "imp": clf.feature_importances_}
     ).sort_values("imp", ascending=False)
@@ -248,19 +479,10 @@ def train_model(
     return rc_cum, pr_cum, f1_cum
 
 
-def validate_model(
-    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
-    test=False
-):
-    """Compares new model with status quo production model and compiles/reports the results.
-    Based on results, will either replace model and archive old one or just maintain status quo.
-    
-    Parameters:
-     - `prob_thresh` (float): probability threshold which the classifier will use to determine
-     whether or not there is a match.
-     - `test` (bool): whether in testing or not, will dtermine flow of operations and mute emails appropriately.
-
-    """
+def get_validation_data():
+    """Returns company projects which were set aside for validation (`validate=1` in
+    `attempted_matches`) along with `cert_id` of their matching certificate, and the
+    corresponding certificates."""
     match_query = """
         SELECT
             company_projects.job_number,
@@ -332,6 +554,62 @@ def validate_model(
     with create_connection() as conn:
         validate_company_projects = pd.read_sql(match_query, conn)
         validate_web_df = pd.read_sql(corr_web_certs_query, conn)
+    return validate_company_projects, validate_web_df
+
+
+def calibrate_prefilter(safety_margin=0.05):
+    """Calibrates threshold of the first stage of the matching cascade (see
+    `scorer.prefilter_score`) so that all true matches of the validation set make it through
+    to the second stage, and records it in `results.json` for `matcher.match` to use, along
+    with the `matcher.prefilter_version` it holds for.
+
+    Parameters:
+     - `safety_margin` (float): how far below the lowest prefilter score of a true match the
+     threshold should be set.
+
+    Returns:
+     - calibrated threshold (float)
+
+    """
+    logger.info("calibrating prefilter threshold for 100% recall on validation data")
+    validate_company_projects, validate_web_df = get_validation_data()
+    company_projects = wrangle(validate_company_projects)
+    web_df = wrangle(validate_web_df)
+    true_scores, all_scores = [], []
+    for _, company_project_row in company_projects.iterrows():
+        scores = prefilter_score(company_project_row, web_df)
+        true_scores.extend(scores[web_df.cert_id == company_project_row.cert_id])
+        all_scores.extend(scores)
+    prefilter_thresh = max(min(true_scores) - safety_margin, 0)
+    pass_rate = np.mean(np.array(all_scores) >= prefilter_thresh)
+    logger.info(
+        f"prefilter threshold: {prefilter_thresh} (lowest true match scored "
+        f"{min(true_scores)}), which lets {round(pass_rate * 100, 1)}% of all pairs through."
+    )
+    update_results({
+        "prefilter calibration": {
+            "threshold": prefilter_thresh,
+            "pass rate": pass_rate,
+            "version": prefilter_version,
+        }
+    })
+    return prefilter_thresh
+
+
+def validate_model(
+    prob_thresh=load_config()["machine_learning"]["prboability_thresholds"]["general"],
+    test=False
+):
+    """Compares new model with status quo production model and compiles/reports the results.
+    Based on results, will either replace model and archive old one or just maintain status quo.
+    
+    Parameters:
+     - `prob_thresh` (float): probability threshold which the classifier will use to determine
+     whether or not there is a match.
+     - `test` (bool): whether in testing or not, will dtermine flow of operations and mute emails appropriately.
+
+    """
+    validate_company_projects, validate_web_df = get_validation_data()
     new_results = match(
         version="new",
         company_projects=validate_company_projects,
@@ -340,7 +618,7 @@ def validate_model(
         prob_thresh=prob_thresh,
     )
     analysis_df = pd.merge(
-        new_results[['job_number', 'cert_id', 'pred_prob', 'pred_match', 'total_score']],
+        new_results[['job_number', 'cert_id', 'pred_prob', 'pred_match']],
         validate_company_projects[['job_number', 'cert_id', 'ground_truth']],
         how='left',
         on=['job_number', 'cert_id']
@@ -430,8 +708,7 @@ def validate_model(
         )
         if not test:
             logger.info("adopting new model by default and skipping rest of validation")
-            for filename in ["rf_model.pkl", "rf_features.pkl"]:
-                os.rename("new_" + filename, filename)
+            rename_artifacts("new_rf_{artifact}.pkl", "rf_{artifact}.pkl")
             return  # exit function because there is no basline to validate against
         else:
             logger.info(
@@ -445,7 +722,7 @@ def validate_model(
                 prob_thresh=prob_thresh,
             )
     sq_analysis_df = pd.merge(
-        sq_results[['job_number', 'cert_id', 'pred_prob', 'pred_match', 'total_score']],
+        sq_results[['job_number', 'cert_id', 'pred_prob', 'pred_match']],
         validate_company_projects[['job_number', 'cert_id', 'ground_truth']],
         how='left',
         on=['job_number', 'cert_id']
@@ -490,22 +767,20 @@ def validate_model(
         if test:
             logger.info("skipping files transfers because running in test mode")
         else:
-            for artifact in ["model", "features"]:
-                os.rename(
-                    f"new_rf_{artifact}.pkl",
-                    f"model_archive/rf_new_{artifact}-{datetime.datetime.now().date()}.pkl",
-                )
+            rename_artifacts(
+                "new_rf_{artifact}.pkl",
+                f"model_archive/rf_new_{{artifact}}-{datetime.datetime.now().date()}.pkl",
+            )
     else:
         logger.info("100% recall acheived! Adopting new model and archiving old one.")
         if test:
             logger.info("skipping files transfers because running in test mode")
         else:
-            for artifact in ["model", "features"]:
-                os.rename(
-                    f"rf_{artifact}.pkl",
-                    f"model_archive/rf_{artifact}-{datetime.datetime.now().date()}.pkl",
-                )
-                os.rename(f"new_rf_{artifact}.pkl", f"rf_{artifact}.pkl")
+            rename_artifacts(
+                "rf_{artifact}.pkl",
+                f"model_archive/rf_{{artifact}}-{datetime.datetime.now().date()}.pkl",
+            )
+            rename_artifacts("new_rf_{artifact}.pkl", "rf_{artifact}.pkl")
         for metric, new, sq in zip(
             ("false positive(s)", "max threshold", "average prediction probability"),
             (fp, min_prob, avg_prob),
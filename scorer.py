@@ -1,11 +1,30 @@
 from fuzzywuzzy import fuzz
+from rapidfuzz import process
+from rapidfuzz.distance import Indel
+import pandas as pd
 import numpy as np
-import math
-from utils import create_connection
+from collections import OrderedDict
+from functools import partial
+import threading
+from utils import create_connection, load_config, profile
+from blocker import haversine_km, KM_PER_DEGREE_LAT
 import mysql.connector
 import json
+import sys
+import logging
 
 
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(funcName)s "
+        "- line %(lineno)d"
+    )
+)
+logger.addHandler(log_handler)
+logger.setLevel(logging.INFO)
+
 try:
     with open(".secret.json") as f:
         pws = json.load(f)
@@ -14,19 +33,40 @@ try:
 except FileNotFoundError:  # no `.secret.json` file if running in CI
     pass
 
-def compile_score(row, scoreable_attrs, style):
-    """Compiles the total score of each column in the row that was individually scored
-    against its attribute counterpart and sports the `_score` suffix."""
-    scores = row[[f"{attr}_score" for attr in scoreable_attrs]]
-    scores = [x / 100 for x in scores if type(x) == int]
+PREFILTER_PROXIMITY_SCALE = 0.05  # degrees, which is roughly 5 km
+MISSING_DISTANCE_KM = KM_PER_DEGREE_LAT  # same as missing `geocode_proximity_score` of 1
+
+score_cache = OrderedDict()  # (web_str, company_project_str, match_style) -> score
+score_cache_lock = threading.Lock()  # `match` runs in threaded Flask request handlers
+
+def compile_score(scores_df, scoreable_attrs, style):
+    """Compiles the total score of each row from the columns that were individually scored
+    against their attribute counterparts and sport the `_score` suffix. Missing scores are
+    left out.
+
+    Parameters:
+     - `scores_df` (pd.DataFrame): dataframe containing a `{attr}_score` column for each
+     of `scoreable_attrs`.
+     - `scoreable_attrs` (list): attributes to compile.
+     - `style` (str): `"multiply"` for the average of non-zero scores (or 0 if there are 2
+     or fewer of them), or `"add"` for the sum of scores.
+
+    Returns:
+     - a Pandas Series of total scores, aligned with `scores_df`.
+
+    """
+    scores = scores_df[[f"{attr}_score" for attr in scoreable_attrs]].values.astype(float)
+    scores = scores / 100
+    total = np.zeros(len(scores_df))
+    for attr_col in scores.T:  # summed one attribute at a time, like built-in `sum`
+        total = total + np.nan_to_num(attr_col)
     if style == "multiply":
-        countable_attrs = len([x for x in scores if x > 0])
-        score = sum(scores) / countable_attrs if countable_attrs > 2 else 0
-    elif style == "add":
-        score = sum(scores)
-    else:
+        countable_attrs = (scores > 0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.where(countable_attrs > 2, total / countable_attrs, 0)
+    elif style != "add":
         raise ValueError(f"style parameter {style} not recognized")
-    return score
+    return pd.Series(total, index=scores_df.index)
 
 
 def attr_score(web_str, company_project_str, match_style="full"):
@@ -50,11 +90,174 @@ def attr_score(web_str, company_project_str, match_style="full"):
     except TypeError:
         return 0
 
+
+def attr_score_matrix(web_strs, company_project_strs, match_style="full"):
+    """Batched version of `attr_score`, comparing every web certificate string against
+    every company project string of the same attribute at once. Scores are identical to
+    calling `attr_score` on each pair.
+
+    Full ratios are computed from Indel distances (which is what fuzzywuzzy's
+    python-Levenshtein backend does) using RapidFuzz's multithreaded `cdist`. Partial
+    ratios still go through fuzzywuzzy since RapidFuzz aligns substrings differently and
+    would change scores that existing models were trained on.
+
+    Parameters:
+     - `web_strs` (list-like): attribute values of web certificates.
+     - `company_project_strs` (list-like): attribute values of company projects.
+     - `match_style` (str): `"full"` or `"partial"`, as in `attr_score`.
+
+    Returns:
+     - a numpy array of int scores of shape `(len(web_strs), len(company_project_strs))`.
+
+    """
+    web_strs = np.asarray(web_strs, dtype=object)
+    company_project_strs = np.asarray(company_project_strs, dtype=object)
+    scores = np.zeros((len(web_strs), len(company_project_strs)), dtype=int)
+    web_is_str = np.array([type(x) == str for x in web_strs], dtype=bool)
+    company_is_str = np.array([type(x) == str for x in company_project_strs], dtype=bool)
+    web_is_empty = np.isin(web_strs[web_is_str], ["", " ", "NaN", "nan"])
+    web_pos = np.flatnonzero(web_is_str)[~web_is_empty]
+    company_pos = np.flatnonzero(company_is_str)
+    if len(web_pos) and len(company_pos):
+        web_scoreable = list(web_strs[web_pos])
+        company_scoreable = list(company_project_strs[company_pos])
+        if match_style == "full":
+            distances = process.cdist(
+                web_scoreable, company_scoreable, scorer=Indel.distance, workers=-1
+            )
+            web_lens = np.array([len(x) for x in web_scoreable])
+            company_lens = np.array([len(x) for x in company_scoreable])
+            lensum = web_lens[:, None] + company_lens[None, :]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                ratios = (lensum - distances) / lensum
+            block = np.round(100 * np.nan_to_num(ratios)).astype(int)
+        else:
+            block = np.array(
+                [
+                    [fuzz.partial_ratio(web_str, x) for x in company_scoreable]
+                    for web_str in web_scoreable
+                ],
+                dtype=int,
+            ).reshape(len(web_scoreable), len(company_scoreable))
+        scores[np.ix_(web_pos, company_pos)] = block
+    unscoreable = ~(web_is_str[:, None] & company_is_str[None, :])
+    for web_i, company_i in zip(*np.nonzero(unscoreable)):
+        scores[web_i, company_i] = attr_score(
+            web_strs[web_i], company_project_strs[company_i], match_style=match_style
+        )  # non-string values keep fuzzywuzzy's quirks (e.g. `None` or equal numbers)
+    return scores
+
+
+def attr_scores(
+    web_strs,
+    company_project_str,
+    match_style="full",
+    dedupe=True,
+    cache_size=load_config()["scorer"]["score_cache_size"],
+):
+    """Scores one company project attribute against a whole column of web certificate
+    attributes. See `attr_score_matrix`.
+
+    Parameters:
+     - `web_strs` (list-like): attribute values of web certificates.
+     - `company_project_str` (str): attribute value of company project.
+     - `match_style` (str): `"full"` or `"partial"`, as in `attr_score`.
+     - `dedupe` (bool): whether to only score unique values of `web_strs` and broadcast
+     results back to all rows. Also looks scores up in (and adds them to) `score_cache`,
+     which is shared across projects and threads for the lifetime of the process. Only
+     pairs of strings get cached, since missing values (`None`, `nan`) never equal each
+     other as keys.
+     - `cache_size` (int): max number of entries kept in `score_cache`, dropping least
+     recently used ones first. Set to 0 to disable caching.
+
+    Returns:
+     - a numpy array of int scores aligned with `web_strs`.
+
+    """
+    if not dedupe:
+        scores = attr_score_matrix(web_strs, [company_project_str], match_style=match_style)
+        return scores[:, 0]
+    codes, uniques = pd.factorize(np.asarray(web_strs, dtype=object))
+    keys = [(x, company_project_str, match_style) for x in uniques]
+    cacheable = [
+        bool(cache_size) and isinstance(x, str) and isinstance(company_project_str, str)
+        for x in uniques
+    ]
+    unique_scores = np.zeros(len(uniques) + 1, dtype=int)  # last one is for missing values
+    misses = []
+    with score_cache_lock:
+        for i, key in enumerate(keys):
+            cached = score_cache.get(key) if cacheable[i] else None
+            if cached is not None:
+                unique_scores[i] = cached
+                score_cache.move_to_end(key)
+            else:
+                misses.append(i)
+    if misses:
+        unique_scores[misses] = attr_score_matrix(
+            np.asarray(uniques, dtype=object)[misses],
+            [company_project_str],
+            match_style=match_style,
+        )[:, 0]
+        if cache_size:
+            with score_cache_lock:
+                for i in misses:
+                    if cacheable[i]:
+                        score_cache[keys[i]] = int(unique_scores[i])
+                while len(score_cache) > cache_size:
+                    score_cache.popitem(last=False)
+    return unique_scores[codes]  # missing values have code -1 and score 0, as in `attr_score`
+
+
 def geocode_proximity_score(lat1, lng1, lat2, lng2):
-    proximity = ((lat1-lat2)**2 + (lng1-lng2)**2)**0.5
-    if math.isnan(proximity):
-        proximity = 1
-    return proximity
+    """Returns distance in decimal degrees between two points (or arrays of points), or 1
+    where any coordinate is missing."""
+    lat1, lng1, lat2, lng2 = (
+        np.asarray(x, dtype=float) for x in (lat1, lng1, lat2, lng2)
+    )
+    proximity = ((lat1 - lat2) ** 2 + (lng1 - lng2) ** 2) ** 0.5
+    proximity = np.where(np.isnan(proximity), 1, proximity)
+    return proximity if proximity.ndim else float(proximity)
+
+
+def great_circle_distance_score(lat1, lng1, lat2, lng2):
+    """Returns great-circle distance in kilometres between two points (or arrays of
+    points), or `MISSING_DISTANCE_KM` where any coordinate is missing. Unlike
+    `geocode_proximity_score`, a given value means the same distance at any latitude."""
+    distance = haversine_km(lat1, lng1, lat2, lng2)
+    distance = np.where(np.isnan(distance), MISSING_DISTANCE_KM, distance)
+    return distance if distance.ndim else float(distance)
+
+
+def prefilter_score(single_project_row, web_df):
+    """Cheap score used as first stage of the matching cascade, so that full feature
+    extraction and the random forest only run on plausible candidates. It's the better of
+    contractor name similarity and geographic closeness (1 at same location, down to 0 at
+    `PREFILTER_PROXIMITY_SCALE` degrees away or if location is unknown).
+
+    Parameters:
+     - `single_project_row` (pd.Series): wrangled row of company project to match.
+     - `web_df` (pd.DataFrame): wrangled dataframe of CSP certificates to match to the
+     company project.
+
+    Returns:
+     - a Pandas Series of scores ranging from 0 to 1, aligned with `web_df`.
+
+    """
+    if not len(web_df):
+        return pd.Series(index=web_df.index, dtype=float)
+    contractor_score = pd.Series(
+        attr_scores(web_df.contractor.values, single_project_row.contractor),
+        index=web_df.index,
+    )
+    proximity = geocode_proximity_score(
+        web_df.address_lat.values,
+        web_df.address_lng.values,
+        single_project_row.address_lat,
+        single_project_row.address_lng,
+    )
+    closeness = np.clip(1 - proximity / PREFILTER_PROXIMITY_SCALE, 0, None)
+    return np.maximum(contractor_score / 100, closeness)
 
 def use_fresh_certs_only(single_project_row, web_df):
     """if True, `last_cert_id_check` will be read for assembling only fresh
@@ -85,7 +288,428 @@ def use_fresh_certs_only(single_project_row, web_df):
             conn.commit()
     return web_df
 
-def build_match_score(single_project_df, web_df, fresh_cert_limit=True):
+def get_fresh_certs(single_project_row, web_df):
+    """Returns subset of `web_df` that is fresh for given project, i.e. certificates with a
+    `cert_id` above project's `last_cert_id_check`. Unlike `use_fresh_certs_only`, this
+    does not touch the database - see `record_cert_id_checks`.
+    
+    Parameters:
+     - `single_project_row` (pd.Series): row of company project to match.
+     - `web_df` (pd.DataFrame): dataframe of CSP certificates to match to the
+     company project.
+
+    Returns:
+     - a Pandas DataFrame containing fresh certificates for given project, or all of
+     `web_df` if project was never checked before.
+    
+    """
+    try:
+        return web_df[web_df.cert_id > int(single_project_row.last_cert_id_check)].copy()
+    except (TypeError, ValueError, AttributeError):  # last_cert_id_check was `NULL`
+        return web_df
+
+
+def record_cert_id_checks(cert_id_checks):
+    """Updates `last_cert_id_check` of many company projects at once, using a single
+    `UPDATE` statement.
+    
+    Parameters:
+     - `cert_id_checks` (dict): new `last_cert_id_check` value keyed by `project_id`.
+
+    """
+    if not cert_id_checks:
+        return
+    cert_id_checks = {int(key): int(value) for key, value in cert_id_checks.items()}
+    update_query = f"""
+        UPDATE company_projects
+        SET last_cert_id_check = CASE project_id
+            {' '.join(['WHEN %s THEN %s'] * len(cert_id_checks))}
+        END
+        WHERE project_id IN ({','.join(['%s'] * len(cert_id_checks))})
+    """
+    params = [x for item in cert_id_checks.items() for x in item] + list(cert_id_checks)
+    with create_connection() as conn:
+        conn.cursor().execute(update_query, params)
+        conn.commit()
+
+
+scoreable_strings = [
+    "contractor",
+    "street_name",
+    "street_number",
+    "title",
+    "city",
+    "owner"
+]
+
+
+def score_string_feature(
+    web_df, company_project_row, scores, attr, match_style, dedupe=True
+):
+    """Computes `{attr}_score` (full) or `{attr}_pr_score` (partial) feature."""
+    return attr_scores(
+        web_df[attr].values, company_project_row[attr], match_style=match_style, dedupe=dedupe
+    )
+
+
+def score_geocode_proximity_feature(web_df, company_project_row, scores, dedupe=True):
+    """Computes `geocode_proximity_score` feature."""
+    return geocode_proximity_score(
+        web_df.address_lat.values,
+        web_df.address_lng.values,
+        company_project_row.address_lat,
+        company_project_row.address_lng,
+    )
+
+
+def score_great_circle_distance_feature(web_df, company_project_row, scores, dedupe=True):
+    """Computes `great_circle_distance_score` feature."""
+    return great_circle_distance_score(
+        web_df.address_lat.values,
+        web_df.address_lng.values,
+        company_project_row.address_lat,
+        company_project_row.address_lng,
+    )
+
+
+def score_total_feature(web_df, company_project_row, scores, dedupe=True):
+    """Computes `total_score` feature out of the full `{attr}_score` features."""
+    scores_df = pd.DataFrame(
+        {f"{attr}_score": np.asarray(scores[f"{attr}_score"]) for attr in scoreable_strings}
+    )
+    return compile_score(scores_df, scoreable_strings, "multiply").values
+
+
+# feature name -> (function computing it, features it needs computed first), in the order
+# features get computed and added as columns by `build_match_score`. Functions take wrangled
+# certificates, the wrangled company project row, and a mapping of features computed so far.
+feature_registry = {
+    f"{string}_{string_suffix}": (
+        partial(score_string_feature, attr=string, match_style=match_style),
+        [],
+    )
+    for string in scoreable_strings
+    for string_suffix, match_style in zip(["score", "pr_score"], ["full", "partial"])
+}
+feature_registry["geocode_proximity_score"] = (score_geocode_proximity_feature, [])
+feature_registry["great_circle_distance_score"] = (score_great_circle_distance_feature, [])
+feature_registry["total_score"] = (
+    score_total_feature,
+    [f"{string}_score" for string in scoreable_strings],
+)
+scorer_version = 1  # bump whenever feature output changes, to invalidate stored training features
+
+
+def score_string_feature_matrix(web_df, company_projects, scores, attr, match_style):
+    """Computes `{attr}_score` (full) or `{attr}_pr_score` (partial) feature of every
+    certificate against every company project, scoring each unique pair of strings once."""
+    codes, uniques = pd.factorize(np.asarray(web_df[attr].values, dtype=object))
+    project_strs = np.asarray(company_projects[attr].values, dtype=object)
+    is_str = np.array([type(x) == str for x in project_strs], dtype=bool)
+    project_codes = np.empty(len(project_strs), dtype=int)
+    project_codes[is_str], project_uniques = pd.factorize(project_strs[is_str])
+    project_codes[~is_str] = len(project_uniques) + np.arange((~is_str).sum())
+    matrix = np.zeros(
+        (len(uniques) + 1, len(project_uniques) + (~is_str).sum()), dtype=int
+    )  # last row is for missing values, which score 0 as in `attr_scores`
+    matrix[:-1] = attr_score_matrix(
+        uniques,
+        np.concatenate([np.asarray(project_uniques, dtype=object), project_strs[~is_str]]),
+        match_style=match_style,
+    )
+    return matrix[codes][:, project_codes]
+
+
+def score_geocode_proximity_feature_matrix(web_df, company_projects, scores):
+    """Computes `geocode_proximity_score` feature of every certificate against every
+    company project."""
+    return geocode_proximity_score(
+        web_df.address_lat.values[:, None],
+        web_df.address_lng.values[:, None],
+        company_projects.address_lat.values[None, :],
+        company_projects.address_lng.values[None, :],
+    )
+
+
+def score_great_circle_distance_feature_matrix(web_df, company_projects, scores):
+    """Computes `great_circle_distance_score` feature of every certificate against every
+    company project."""
+    return great_circle_distance_score(
+        web_df.address_lat.values[:, None],
+        web_df.address_lng.values[:, None],
+        company_projects.address_lat.values[None, :],
+        company_projects.address_lng.values[None, :],
+    )
+
+
+def score_total_feature_matrix(web_df, company_projects, scores):
+    """Computes `total_score` feature of every certificate against every company project
+    out of the full `{attr}_score` features."""
+    shape = np.shape(scores["city_score"])
+    scores_df = pd.DataFrame(
+        {
+            f"{attr}_score": np.asarray(scores[f"{attr}_score"]).ravel()
+            for attr in scoreable_strings
+        }
+    )
+    return compile_score(scores_df, scoreable_strings, "multiply").values.reshape(shape)
+
+
+# feature name -> function computing it for every certificate against every company project
+# at once, as a `(len(web_df), len(company_projects))` array (see `score_cross_pairs`).
+# Dependencies are the ones of `feature_registry`.
+feature_matrix_registry = {
+    f"{string}_{string_suffix}": partial(
+        score_string_feature_matrix, attr=string, match_style=match_style
+    )
+    for string in scoreable_strings
+    for string_suffix, match_style in zip(["score", "pr_score"], ["full", "partial"])
+}
+feature_matrix_registry["geocode_proximity_score"] = score_geocode_proximity_feature_matrix
+feature_matrix_registry["great_circle_distance_score"] = (
+    score_great_circle_distance_feature_matrix
+)
+feature_matrix_registry["total_score"] = score_total_feature_matrix
+
+
+def get_required_features(features=None, great_circle=False):
+    """Returns names of registered features which need to be computed to provide
+    `features`, including the ones they depend on, in the order of `feature_registry`.
+
+    Parameters:
+     - `features` (list-like): features needed, typically the feature list of the model
+     about to be used (see `matcher.load_feature_list`). Features missing from the
+     registry are ignored. Default is `None`, which stands for all registered features.
+     - `great_circle` (bool): whether to include `great_circle_distance_score` when all
+     features are requested.
+
+    """
+    if features is None:
+        return [
+            feature
+            for feature in feature_registry
+            if great_circle or feature != "great_circle_distance_score"
+        ]
+    required, pending = set(), list(features)
+    while pending:
+        feature = pending.pop()
+        if feature in feature_registry and feature not in required:
+            required.add(feature)
+            pending.extend(feature_registry[feature][1])
+    return [feature for feature in feature_registry if feature in required]
+
+
+def compute_features(
+    company_project_row,
+    web_df,
+    features=None,
+    dedupe=load_config()["scorer"]["dedupe_values"],
+    great_circle=load_config()["scorer"]["great_circle_distance"],
+):
+    """Computes `features` (and whatever they depend on) of a wrangled company project
+    against wrangled certificates `web_df`, without touching `web_df`.
+
+    Returns:
+     - dict of numpy arrays aligned with `web_df`, keyed by feature name, in the order of
+     `feature_registry`. Features which couldn't be computed because of a missing
+     attribute are left out.
+
+    """
+    scores = {}
+    for feature in get_required_features(features, great_circle):
+        score_feature = feature_registry[feature][0]
+        try:
+            with profile(f"build_match_score/{feature}", len(web_df)):
+                scores[feature] = score_feature(
+                    web_df, company_project_row, scores, dedupe=dedupe
+                )
+        except KeyError as e:  # attribute missing from certificates or project
+            logger.warning(f"can't compute `{feature}`, missing attribute {e}")
+    return scores
+
+
+class ScoredPairs:
+    """Compact representation of scored (company project, certificate) pairs, as opposed
+    to a copy of the certificates table with score columns added for every project. Each
+    pair takes 4 bytes per feature plus 8 bytes of positions, i.e. 64 bytes with all 14
+    features. Feature values are stored as float32, which is also what scikit-learn's
+    random forests cast them to, so predictions are unaffected.
+
+    Parameters:
+     - `features` (np.ndarray): float32 array of shape `(n_pairs, len(feature_names))`.
+     - `feature_names` (list): names of the columns of `features`.
+     - `project_pos` (np.ndarray): int32 position of each pair's company project within
+     the table of company projects being matched.
+     - `cert_pos` (np.ndarray): int32 position of each pair's certificate within the table
+     of certificates being matched.
+
+    """
+
+    def __init__(self, features, feature_names, project_pos, cert_pos):
+        self.features = features
+        self.feature_names = list(feature_names)
+        self.project_pos = project_pos
+        self.cert_pos = cert_pos
+
+    def __len__(self):
+        return len(self.features)
+
+    def take(self, positions):
+        """Returns a `ScoredPairs` holding only pairs at given positions (or mask)."""
+        return ScoredPairs(
+            self.features[positions],
+            self.feature_names,
+            self.project_pos[positions],
+            self.cert_pos[positions],
+        )
+
+    def get_matrix(self, feature_names):
+        """Returns feature matrix with columns in the order of `feature_names` (e.g. the
+        feature list of a model), without copying if already in that order."""
+        if list(feature_names) == self.feature_names:
+            return self.features
+        return self.features[:, [self.feature_names.index(x) for x in feature_names]]
+
+    def to_frame(self, company_projects, web_df):
+        """Expands pairs into a dataframe of wrangled certificate attributes, features, and
+        `job_number` (and `project_id` if available) of the company project, as returned
+        by `build_match_score`.
+
+        Parameters:
+         - `company_projects` (pd.DataFrame): company projects `project_pos` refers to.
+         - `web_df` (pd.DataFrame): certificates `cert_pos` refers to.
+
+        """
+        results = web_df.iloc[self.cert_pos].copy()
+        for i, feature in enumerate(self.feature_names):
+            results[feature] = self.features[:, i]
+        results["job_number"] = company_projects.job_number.values[self.project_pos]
+        if "project_id" in company_projects.columns:
+            results["project_id"] = company_projects.project_id.values[self.project_pos]
+        return results
+
+
+def concat_scored_pairs(scored_pairs, feature_names=None):
+    """Concatenates many `ScoredPairs` (e.g. one per project) into one. `feature_names` is
+    only needed when `scored_pairs` might be empty."""
+    scored_pairs = list(scored_pairs)
+    if not scored_pairs:
+        return ScoredPairs(
+            np.empty((0, len(feature_names or [])), dtype=np.float32),
+            feature_names or [],
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int32),
+        )
+    return ScoredPairs(
+        np.concatenate([x.features for x in scored_pairs]),
+        scored_pairs[0].feature_names,
+        np.concatenate([x.project_pos for x in scored_pairs]),
+        np.concatenate([x.cert_pos for x in scored_pairs]),
+    )
+
+
+def score_pairs(
+    company_project_row,
+    web_df,
+    project_pos=0,
+    cert_pos=None,
+    features=None,
+    dedupe=load_config()["scorer"]["dedupe_values"],
+    great_circle=load_config()["scorer"]["great_circle_distance"],
+):
+    """Scores a wrangled company project against wrangled certificates into compact
+    `ScoredPairs`, without touching `web_df`. Counterpart of `build_match_score`.
+
+    Parameters:
+     - `company_project_row` (pd.Series): wrangled company project to score.
+     - `web_df` (pd.DataFrame): wrangled certificates to score against.
+     - `project_pos` (int): position of the company project in the table of projects
+     being matched.
+     - `cert_pos` (list-like): positions of `web_df` rows in the table of certificates
+     being matched. Default is `web_df.index`, which is right as long as `web_df` is a
+     subset of a certificates table with a default `RangeIndex`.
+     - `features` (list-like): features to provide, in order. Default is `None`, for all
+     features (see `get_required_features`).
+     - `dedupe`, `great_circle`: see `build_match_score`.
+
+    Returns:
+     - a `ScoredPairs` instance.
+
+    """
+    feature_names = (
+        list(features) if features is not None else get_required_features(None, great_circle)
+    )
+    with profile("build_match_score", len(web_df)):
+        scores = compute_features(
+            company_project_row,
+            web_df,
+            features=feature_names,
+            dedupe=dedupe,
+            great_circle=great_circle,
+        )
+    tensor = np.empty((len(web_df), len(feature_names)), dtype=np.float32)
+    for i, feature in enumerate(feature_names):
+        tensor[:, i] = scores.get(feature, np.nan)
+    return ScoredPairs(
+        tensor,
+        feature_names,
+        np.full(len(web_df), project_pos, dtype=np.int32),
+        np.asarray(web_df.index if cert_pos is None else cert_pos, dtype=np.int32),
+    )
+
+
+def score_cross_pairs(
+    company_projects,
+    web_df,
+    features=None,
+    great_circle=load_config()["scorer"]["great_circle_distance"],
+):
+    """Scores every wrangled company project against every wrangled certificate, one
+    vectorized pass per feature (see `feature_matrix_registry`) rather than one project at a
+    time. Scores are the same as `score_pairs`'.
+
+    Parameters:
+     - `company_projects` (pd.DataFrame): wrangled company projects to score.
+     - `web_df` (pd.DataFrame): wrangled certificates to score against.
+     - `features`, `great_circle`: see `score_pairs`.
+
+    Returns:
+     - a `ScoredPairs` instance holding all `len(company_projects) * len(web_df)` pairs,
+     project by project, with positions within `company_projects` and `web_df`.
+
+    """
+    feature_names = (
+        list(features) if features is not None else get_required_features(None, great_circle)
+    )
+    n_projects, n_certs = len(company_projects), len(web_df)
+    scores = {}
+    for feature in get_required_features(feature_names, great_circle):
+        try:
+            with profile(f"score_cross_pairs/{feature}", n_projects * n_certs):
+                scores[feature] = feature_matrix_registry[feature](
+                    web_df, company_projects, scores
+                )
+        except KeyError as e:  # attribute missing from certificates or projects
+            logger.warning(f"can't compute `{feature}`, missing attribute {e}, left as nan")
+    tensor = np.empty((n_projects * n_certs, len(feature_names)), dtype=np.float32)
+    for i, feature in enumerate(feature_names):
+        tensor[:, i] = np.asarray(scores[feature]).T.ravel() if feature in scores else np.nan
+    return ScoredPairs(
+        tensor,
+        feature_names,
+        np.repeat(np.arange(n_projects, dtype=np.int32), n_certs),
+        np.tile(np.arange(n_certs, dtype=np.int32), n_projects),
+    )
+
+
+def build_match_score(
+    single_project_df,
+    web_df,
+    fresh_cert_limit=True,
+    dedupe=load_config()["scorer"]["dedupe_values"],
+    great_circle=load_config()["scorer"]["great_circle_distance"],
+    features=None,
+):
     """Builds a possible match dataframe of one-to many relationship between specified
     company project and all web certificates along with many added columns of engineered
     features that the Random Forest Classifier will be looking for.
@@ -96,6 +720,13 @@ def build_match_score(single_project_df, web_df, fresh_cert_limit=True):
      - `web_df` (pd.DataFrame): specify dataframe of CSP certificates to match to the
      company project.
      - `fresh_cert_limit` (bool): specify whether or not to apply `use_fresh_certs_only()`
+     - `dedupe` (bool): specify whether to score unique certificate values only and use
+     the score cache, see `attr_scores`
+     - `great_circle` (bool): specify whether to add the `great_circle_distance_score`
+     feature (distance in km) alongside `geocode_proximity_score` (distance in degrees)
+     - `features` (list-like): specify features to compute (e.g. feature list of the
+     model that will be used), along with whatever they depend on. Default is `None`,
+     which computes all features (training needs them all).
 
     Returns:
      - a Pandas DataFrame containing new certificates if Test=True
@@ -106,19 +737,6 @@ def build_match_score(single_project_df, web_df, fresh_cert_limit=True):
             f"`company_projects` dataframe was suppose to conatin only 1 single row - "
             f"it contained {len(single_project_df)} rows instead."
         )
-    scoreable_strings = [
-        "contractor",
-        "street_name",
-        "street_number",
-        "title",
-        "city",
-        "owner"
-    ]
-    scoreable_floats = [
-        "address_lat",
-        "address_lng"
-    ]
-    scoreable_attrs = scoreable_strings + scoreable_floats
     for (
         _,
         company_project_row,
@@ -129,36 +747,14 @@ def build_match_score(single_project_df, web_df, fresh_cert_limit=True):
             possible_matches_scored = use_fresh_certs_only(company_project_row, web_df)
         else:
             possible_matches_scored = web_df
-        # import pdb; pdb.set_trace()
-        for string in scoreable_strings:
-            for string_suffix, match_style in zip(
-                ["score", "pr_score"], ["full", "partial"]
-            ):
-                try:
-                    possible_matches_scored[
-                        f"{string}_{string_suffix}"
-                    ] = possible_matches_scored.apply(
-                        lambda web_row: attr_score(
-                            web_row[string],
-                            company_project_row[string],
-                            match_style=match_style,
-                        ),
-                        axis=1,
-                    )
-                except:
-                    print(string)
-
-        possible_matches_scored["geocode_proximity_score"] = possible_matches_scored.apply(
-            lambda web_row: geocode_proximity_score(
-                web_row['address_lat'],
-                web_row['address_lng'],
-                company_project_row['address_lat'],
-                company_project_row['address_lng'],
-            ),
-            axis=1
-        )
-
-        possible_matches_scored["total_score"] = possible_matches_scored.apply(
-            lambda row: compile_score(row, scoreable_strings, "multiply"), axis=1
-        )
+        with profile("build_match_score", len(possible_matches_scored)):
+            scores = compute_features(
+                company_project_row,
+                possible_matches_scored,
+                features=features,
+                dedupe=dedupe,
+                great_circle=great_circle,
+            )
+        for feature, values in scores.items():
+            possible_matches_scored[feature] = values
         return possible_matches_scored
@@ -9,6 +9,7 @@ import progressbar
 from time import sleep
 from utils import create_connection
 from geocoder import geocode
+from wrangler import get_wrangled_columns, add_wrangled_columns, wrangled_columns
 import sys
 import logging
 import dateutil.parser
@@ -448,6 +449,7 @@ def scrape(
     df_web = geocode(df_web)
     if test:
         return df_web
+    df_web = pd.concat([df_web, get_wrangled_columns(df_web)], axis=1)
     attrs = [
         "cert_id",
         "pub_date",
@@ -465,7 +467,9 @@ def scrape(
         "url_key",
         "cert_type",
         "source",
+        *wrangled_columns,
     ]
+    add_wrangled_columns("web_certificates")
     query = f""" 
         INSERT INTO web_certificates 
         ({', '.join(attrs)}) VALUES ({','.join(['%s']*len(attrs))})
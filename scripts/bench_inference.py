@@ -0,0 +1,112 @@
+import add_parent_to_path
+import numpy as np
+import argparse
+import time
+import sys
+import logging
+from matcher import load_model, load_forest, load_feature_list
+from forest import flatten_forest, predict_forest_proba, flat_forest_matches
+
+
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(funcName)s "
+        "- line %(lineno)d"
+    )
+)
+logger.addHandler(log_handler)
+logger.setLevel(logging.INFO)
+
+# feature name -> range of values drawn for it, all other features being fuzzy match scores
+feature_ranges = {
+    "geocode_proximity_score": (0, 1),
+    "great_circle_distance_score": (0, 100),
+    "total_score": (0, 1),
+}
+
+
+def random_features(feature_list, n_samples, seed=42):
+    """Returns a random feature matrix of `n_samples` rows with plausible values for every
+    feature of `feature_list`."""
+    rng = np.random.RandomState(seed)
+    return np.column_stack(
+        [
+            rng.uniform(*feature_ranges[feature], size=n_samples)
+            if feature in feature_ranges
+            else rng.randint(0, 101, size=n_samples).astype(float)
+            for feature in feature_list
+        ]
+    )
+
+
+def best_time(func, min_seconds=0.5, max_runs=1000):
+    """Returns the fastest of repeated calls of `func` in seconds, calling it for at least
+    `min_seconds` overall (or `max_runs` times)."""
+    timings = []
+    while sum(timings) < min_seconds and len(timings) < max_runs:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_inference(version="status_quo", batch_sizes=(1, 100, 100000)):
+    """Times scikit-learn's `predict_proba` against `forest.predict_forest_proba` for model
+    `version` at each of `batch_sizes`, and checks that both give the same probabilities.
+
+    Returns:
+     - a list of dicts, one per batch size, with timings in milliseconds.
+
+    """
+    clf = load_model(version=version)
+    clf.set_params(n_jobs=None)
+    try:
+        flat = load_forest(version=version)
+    except FileNotFoundError:
+        flat = None
+    if flat is None or not flat_forest_matches(flat, clf):
+        logger.info(f"no matching flattened trees saved with {version} model, flattening it")
+        flat = flatten_forest(clf)
+    features = load_feature_list(version=version)
+    bench = []
+    for batch_size in batch_sizes:
+        X = random_features(features, batch_size)
+        max_diff = np.abs(clf.predict_proba(X) - predict_forest_proba(flat, X)).max()
+        sklearn_ms = best_time(lambda: clf.predict_proba(X)) * 1000
+        flat_ms = best_time(lambda: predict_forest_proba(flat, X)) * 1000
+        logger.info(
+            f"batch of {batch_size}: sklearn {sklearn_ms:.3f}ms, flat {flat_ms:.3f}ms "
+            f"({sklearn_ms / flat_ms:.1f}x), max probability difference {max_diff}"
+        )
+        bench.append(
+            {
+                "batch_size": batch_size,
+                "sklearn_ms": sklearn_ms,
+                "flat_ms": flat_ms,
+                "max_diff": max_diff,
+            }
+        )
+    return bench
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks inference backends of the random forest model."
+    )
+    parser.add_argument(
+        "--version",
+        type=str,
+        default="status_quo",
+        help="model version to benchmark (see `matcher.get_artifact_path`)",
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 100, 100000],
+        help="numbers of samples to predict at once",
+    )
+    args = parser.parse_args()
+    bench_inference(version=args.version, batch_sizes=args.batch_sizes)
@@ -0,0 +1,319 @@
+import add_parent_to_path
+import pandas as pd
+import numpy as np
+import datetime
+import argparse
+import os
+import sys
+import logging
+
+
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(funcName)s "
+        "- line %(lineno)d"
+    )
+)
+logger.addHandler(log_handler)
+logger.setLevel(logging.INFO)
+
+# name, lat, lng, city_size (same units as `geocoder.get_city_size`), relative weight
+cities = [
+    ("Toronto", 43.6532, -79.3832, 0.60, 30),
+    ("Ottawa", 45.4215, -75.6972, 0.64, 20),
+    ("Mississauga", 43.5890, -79.6441, 0.25, 8),
+    ("Brampton", 43.7315, -79.7624, 0.20, 6),
+    ("Hamilton", 43.2557, -79.8711, 0.35, 7),
+    ("London", 42.9849, -81.2453, 0.25, 6),
+    ("Markham", 43.8561, -79.3370, 0.15, 4),
+    ("Vaughan", 43.8563, -79.5085, 0.18, 4),
+    ("Kitchener", 43.4516, -80.4925, 0.12, 4),
+    ("Windsor", 42.3149, -83.0364, 0.15, 4),
+    ("Oshawa", 43.8971, -78.8658, 0.12, 3),
+    ("Barrie", 44.3894, -79.6903, 0.10, 3),
+    ("Guelph", 43.5448, -80.2482, 0.08, 2),
+    ("Kingston", 44.2312, -76.4860, 0.12, 3),
+    ("Sudbury", 46.4917, -80.9930, 0.50, 3),
+    ("Thunder Bay", 48.3809, -89.2477, 0.20, 2),
+    ("Sault Ste. Marie", 46.5136, -84.3358, 0.15, 1),
+    ("St. Catharines", 43.1594, -79.2469, 0.10, 2),
+    ("Niagara Falls", 43.0896, -79.0849, 0.10, 2),
+    ("Peterborough", 44.3091, -78.3197, 0.08, 2),
+    ("Belleville", 44.1628, -77.3832, 0.08, 1),
+    ("North Bay", 46.3091, -79.4608, 0.10, 1),
+    ("Timmins", 48.4758, -81.3305, 0.40, 1),
+    ("Cornwall", 45.0213, -74.7303, 0.06, 1),
+    ("Whitby", 43.8975, -78.9429, 0.08, 2),
+    ("Burlington", 43.3255, -79.7990, 0.10, 2),
+    ("Chatham-Kent", 42.4048, -82.1910, 0.30, 1),
+    ("Pembroke", 45.8262, -77.1110, 0.05, 1),
+    ("Wasaga Beach", 44.5206, -80.0164, 0.05, 1),
+    ("Kenora", 49.7670, -94.4894, 0.10, 1),
+]
+city_formats = [
+    "{}",
+    "{}",
+    "{}, Ontario",
+    "City of {}",
+    "{} ON",
+    "Town of {}",
+    "Region of Durham, City of {}",
+    "{} - Building Department",
+]
+street_names = [
+    "Sparks", "Kent", "Bank", "Queen", "King", "Yonge", "Bloor", "Dundas", "Main",
+    "Wellington", "Carling", "Richmond", "Baseline", "Hunt Club", "Merivale", "Bronson",
+    "Elgin", "Albert", "Slater", "Laurier", "Rideau", "Montreal", "St. Laurent", "Innes",
+    "Cassidy", "Aviation", "Del Zotto", "Smyth", "Talbot", "Marenger", "Carrière",
+    "Jean-Jacques Lussier", "Holland", "Highcastle", "Sheppard", "Finch", "Eglinton",
+    "Lawrence", "Steeles", "Hurontario", "Dixie", "Airport", "Erin Mills", "Victoria",
+    "Princess", "Division", "Brock", "Ontario", "Lakeshore", "Riverside", "Ouellette",
+]
+street_suffixes = [
+    ("Street", "St."), ("Road", "Rd"), ("Avenue", "Ave."), ("Drive", "Dr."),
+    ("Boulevard", "Blvd"), ("Crescent", "Cres."), ("Court", "Crt"), ("Parkway", "Pkwy"),
+]
+contractor_bases = [
+    "PCL", "EllisDon", "Pomerleau", "Dilfo", "Bird", "Graham", "Ron Eastern", "Laurin",
+    "Frecon", "Percon", "Colonial", "Matheson", "Buttcon", "Bondfield", "Aecon",
+    "Eastern", "Gal-Con", "Louis W. Bray", "Cavanagh", "M. Sullivan", "Tomlinson",
+    "R.E. Hein", "Kenaidan", "Maple Reinders", "Struct-Con", "Arcon", "BGIS", "GNC",
+    "S&R", "G&L", "Brookfield", "Vanbots", "Marant", "Chandos", "Ledcor", "Jacobs",
+]
+contractor_suffixes = [
+    "", " Construction Ltd.", " Constructors Inc.", " Construction Limited",
+    " Mechanical Ltd", " General Contracting", " Builders", " Group Inc.",
+    " Construction (Ontario) Inc.", " Contracting Ltd.", " Industries", " Inc.",
+]
+owner_bases = [
+    "PWGSC", "City of {city}", "{city} Catholic District School Board",
+    "{city} District School Board", "University of {city}", "{city} Hospital",
+    "Hydro One", "Infrastructure Ontario", "Metrolinx", "Ontario Power Generation",
+    "Canada Lands Company", "Regional Municipality of {city}", "Brookfield Properties",
+    "Minto", "Tamarack", "Claridge Homes", "Loblaw Properties", "Canadian Tire",
+]
+building_types = [
+    "High School", "Elementary School", "Library", "Community Centre", "Arena",
+    "Fire Station", "Police Station", "Water Treatment Plant", "Office Building",
+    "Hospital Wing", "Parking Garage", "Transit Station", "Warehouse", "Laboratory",
+    "Long Term Care Home", "Recreation Centre", "Courthouse", "Tower B", "Pool",
+]
+work_types = [
+    "Addition", "Roof Replacement", "Renovation", "HVAC Upgrade", "Fit-Up",
+    "Expansion", "Retrofit", "Repairs", "Modernization", "New Construction",
+    "Window Replacement", "Foundation Repairs", "Accessibility Upgrades",
+]
+title_prefixes = ["", "", "Construct ", "Proposed ", "Phase 2 - ", "Contract #123 - "]
+
+
+def pick(rng, options, size, zipf=False):
+    """Returns `size` random picks of `options` as numpy array of objects. With `zipf`,
+    first options get picked much more often than last ones, which mimics how a few big
+    contractors and owners show up on most certificates."""
+    options = np.array(options, dtype=object)
+    if zipf:
+        weights = 1 / np.arange(1, len(options) + 1)
+        return options[rng.choice(len(options), size, p=weights / weights.sum())]
+    return options[rng.randint(0, len(options), size)]
+
+
+def make_entities(rng, size):
+    """Generates `size` raw project-like entities (city, address, title, owner, contractor,
+    engineer and coordinates) spread across Ontario."""
+    city_weights = np.array([x[4] for x in cities], dtype=float)
+    city_idx = rng.choice(len(cities), size, p=city_weights / city_weights.sum())
+    city_names = np.array([x[0] for x in cities], dtype=object)[city_idx]
+    city_lat = np.array([x[1] for x in cities])[city_idx]
+    city_lng = np.array([x[2] for x in cities])[city_idx]
+    city_size = np.array([x[3] for x in cities])[city_idx]
+    spread = city_size / 5
+    suffix_idx = rng.randint(0, len(street_suffixes), size)
+    suffix = np.array([x[rng.randint(0, 2)] for x in street_suffixes], dtype=object)
+    address = (
+        pd.Series(rng.randint(1, 3000, size)).astype(str)
+        + " "
+        + pick(rng, street_names, size)
+        + " "
+        + suffix[suffix_idx]
+    )
+    contractor = pd.Series(pick(rng, contractor_bases, size, zipf=True)) + pick(
+        rng, contractor_suffixes, size
+    )
+    owner = pd.Series(
+        [
+            owner_base.format(city=city)
+            for owner_base, city in zip(pick(rng, owner_bases, size, zipf=True), city_names)
+        ]
+    )
+    title = (
+        pd.Series(pick(rng, building_types, size)) + " " + pick(rng, work_types, size)
+    )
+    return pd.DataFrame(
+        {
+            "city": city_names,
+            "address": address,
+            "title": title,
+            "owner": owner,
+            "contractor": contractor,
+            "engineer": pick(rng, ["GWAL", "J.L. Richards", "WSP", "Stantec", None], size),
+            "address_lat": city_lat + rng.normal(0, spread, size),
+            "address_lng": city_lng + rng.normal(0, spread * 1.4, size),
+            "city_lat": city_lat,
+            "city_lng": city_lng,
+            "city_size": city_size,
+        }
+    )
+
+
+def perturb(rng, entity):
+    """Returns a certificate-like copy of a raw project entity, written the way a different
+    person would have reported the same project on a CSP source."""
+    cert = entity.copy()
+    city = cert["city"]
+    cert["city"] = rng.choice(city_formats).format(city)
+    address = cert["address"]
+    for long_suffix, short_suffix in street_suffixes:
+        if rng.rand() < 0.5:
+            address = address.replace(long_suffix, short_suffix)
+        else:
+            address = address.replace(short_suffix, long_suffix)
+    cert["address"] = f"{address}, {city}, Ontario" if rng.rand() < 0.6 else address
+    base = next((x for x in contractor_bases if cert["contractor"].startswith(x)), None)
+    if base and rng.rand() < 0.7:
+        cert["contractor"] = base + rng.choice(contractor_suffixes)
+    if rng.rand() < 0.3:
+        cert["contractor"] = cert["contractor"].upper()
+    title = cert["title"]
+    cert["title"] = rng.choice(title_prefixes) + (
+        title.lower() if rng.rand() < 0.3 else title
+    )
+    if rng.rand() < 0.2:
+        cert["owner"] = cert["owner"].replace("University of", "U. of")
+    if rng.rand() < 0.1:  # geocoding failed
+        cert["address_lat"], cert["address_lng"] = np.nan, np.nan
+    else:
+        cert["address_lat"] += rng.normal(0, 0.0005)
+        cert["address_lng"] += rng.normal(0, 0.0005)
+    return cert
+
+
+def generate_scale_data(
+    n_certs, n_projects, match_share=0.5, validate_share=0.2, seed=42,
+    since="2011-01-01", until=None,
+):
+    """Generates realistic `web_certificates`, `company_projects` and `attempted_matches`
+    tables at arbitrary scale, with planted true matches.
+
+    Parameters:
+     - `n_certs` (int): number of certificates to generate.
+     - `n_projects` (int): number of company projects to generate.
+     - `match_share` (float): share of projects which get a planted matching certificate.
+     Half of those are closed and labeled in `attempted_matches` (for training and
+     validation), while the other half are still open and only listed in the answer key.
+     - `validate_share` (float): share of labeled matches flagged with `validate=1`.
+     - `seed` (int): seed of random generator, for reproducible tables.
+     - `since`, `until` (str of format `"yyyy-mm-dd"`): publication date range.
+
+    Returns:
+     - dict of Pandas DataFrames keyed by table name, plus `planted_matches` answer key.
+
+    """
+    rng = np.random.RandomState(seed)
+    until = until or str(datetime.datetime.now().date())
+    logger.info(f"generating {n_projects} company projects...")
+    company_projects = make_entities(rng, n_projects)
+    company_projects.insert(0, "project_id", np.arange(1, n_projects + 1))
+    company_projects.insert(1, "job_number", (1000 + np.arange(n_projects)).astype(str))
+    company_projects["closed"] = 0
+    company_projects["receiver_emails_dump"] = "{'Alex': 'alex@dilfo.com'}"
+    company_projects["company_id"] = rng.randint(1, 1 + max(n_projects // 50, 1), n_projects)
+    company_projects["last_cert_id_check"] = np.nan
+    logger.info(f"generating {n_certs} certificates...")
+    web_certificates = make_entities(rng, n_certs)
+    n_matches = min(int(n_projects * match_share), n_certs)
+    matched_projects = rng.choice(n_projects, n_matches, replace=False)
+    matched_certs = rng.choice(n_certs, n_matches, replace=False)
+    logger.info(f"planting {n_matches} true matches...")
+    cert_cols = list(web_certificates.columns)
+    planted = [
+        perturb(rng, company_projects.iloc[project_pos][cert_cols])
+        for project_pos in matched_projects
+    ]
+    web_certificates.iloc[matched_certs] = pd.DataFrame(planted).values
+    start, end = pd.Timestamp(since), pd.Timestamp(until)
+    web_certificates["pub_date"] = (
+        start + pd.to_timedelta(rng.randint(0, (end - start).days + 1, n_certs), unit="D")
+    ).strftime("%Y-%m-%d")
+    web_certificates["url_key"] = [
+        f"{x:016X}{y:016X}"
+        for x, y in rng.randint(0, 2 ** 63 - 1, (n_certs, 2), dtype=np.int64)
+    ]
+    web_certificates["source"] = pick(rng, ["dcn", "ocn", "l2b"], n_certs)
+    web_certificates["cert_type"] = "csp"
+    order = np.argsort(web_certificates.pub_date.values, kind="stable")
+    cert_ids = np.empty(n_certs, dtype=int)
+    cert_ids[order] = np.arange(1, n_certs + 1)  # cert_id increases with pub_date
+    web_certificates.insert(0, "cert_id", cert_ids)
+    web_certificates = web_certificates.iloc[order].reset_index(drop=True)
+    planted_matches = pd.DataFrame(
+        {
+            "project_id": company_projects.project_id.values[matched_projects],
+            "cert_id": cert_ids[matched_certs],
+            "labeled": rng.rand(n_matches) < 0.5,
+        }
+    )
+    labeled = planted_matches[planted_matches.labeled]
+    company_projects.loc[company_projects.project_id.isin(labeled.project_id), "closed"] = 1
+    attempted_matches = pd.DataFrame(
+        {
+            "project_id": labeled.project_id,
+            "cert_id": labeled.cert_id,
+            "ground_truth": 1,
+            "validate": (rng.rand(len(labeled)) < validate_share).astype(int),
+            "multi_phase": 0,
+            "log_date": until,
+        }
+    )
+    return {
+        "company_projects": company_projects,
+        "web_certificates": web_certificates[
+            [
+                "cert_id", "pub_date", "city", "address", "title", "owner", "contractor",
+                "engineer", "url_key", "source", "cert_type", "address_lat",
+                "address_lng", "city_lat", "city_lng", "city_size",
+            ]
+        ],
+        "attempted_matches": attempted_matches,
+        "planted_matches": planted_matches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generates synthetic tables for load testing matcher and trainer."
+    )
+    parser.add_argument("--certs", type=int, default=1000000, help="number of certificates")
+    parser.add_argument("--projects", type=int, default=20000, help="number of projects")
+    parser.add_argument(
+        "--match_share",
+        type=float,
+        default=0.5,
+        help="share of projects which get a planted matching certificate",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="seed of random generator")
+    parser.add_argument(
+        "--destination",
+        type=str,
+        default="scale_data",
+        help="directory to save tables to as CSV files (one per table)",
+    )
+    args = parser.parse_args()
+    tables = generate_scale_data(
+        args.certs, args.projects, match_share=args.match_share, seed=args.seed
+    )
+    os.makedirs(args.destination, exist_ok=True)
+    for table_name, table in tables.items():
+        table.to_csv(os.path.join(args.destination, f"{table_name}.csv"), index=False)
+        logger.info(f"saved {len(table)} rows to {args.destination}/{table_name}.csv")
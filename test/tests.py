@@ -20,14 +20,54 @@ from wrangler import (
     get_street_name,
     clean_title,
     wrangle,
+    clean_cache_info,
+    clear_clean_caches,
+    apply_clean_op,
+    get_wrangled_columns,
+    wrangle_rows,
+)
+from matcher import (
+    match,
+    predict_match,
+    predict_matches,
+    flag_multi_phase,
+    predict_model_proba,
+    load_artifact,
+    get_cert_id_checks,
+    load_prefilter_thresh,
+    prefilter_version,
+    score_candidates_parallel,
+    match_new_certs,
 )
-from matcher import match
 from communicator import communicate
+from blocker import GeoGridIndex, TokenIndex
+from forest import flatten_forest, predict_forest_proba, flat_forest_matches
+from sklearn.ensemble import RandomForestClassifier
+from scorer import (
+    attr_score,
+    attr_score_matrix,
+    attr_scores,
+    score_cache,
+    compile_score,
+    geocode_proximity_score,
+    great_circle_distance_score,
+    get_required_features,
+    score_pairs,
+    concat_scored_pairs,
+    score_cross_pairs,
+    get_fresh_certs,
+    record_cert_id_checks,
+    prefilter_score,
+)
 from ml import build_train_set, train_model, validate_model
 from utils import create_connection, load_config
 from test.test_setup import create_test_db
 from flask_app import app
 import os
+import pickle
+import tempfile
+from unittest import mock
+import joblib
 import mysql.connector
 
 
@@ -182,6 +222,460 @@ class TestWrangleFuncs(unittest.TestCase):
         output_string = clean_title(input_string)
         self.assertEqual(desired_string, output_string)
 
+    def test_wrangle_vectorized(self):
+        addresses = [address for address, _, _ in self.address_test_data]
+        names = [" ", "None", None, "PCL Constructors Canada Inc. for GAL Power Systems"]
+        df = pd.DataFrame(
+            {
+                "job_number": ["#12-3", 4, "", None] * 4,
+                "pub_date": ["2019-01-02", "", "x2019-01-02y", None] * 4,
+                "city": ["Ottawa-Carleton", " ", "York Region, Town of Markham", "Lévis"] * 4,
+                "title": ["PDV: Fit-Up;", " ", "testé l'apostrophe", "RECL"] * 4,
+                "owner": names * 4,
+                "contractor": ["Université d'Ottawa", "s and r mech", "RECL", " "] * 4,
+                "engineer": names * 4,
+                "address": addresses,
+            }
+        )
+        pd.testing.assert_frame_equal(
+            wrangle(df.copy(), vectorized=False), wrangle(df.copy(), vectorized=True)
+        )
+
+    def test_wrangle_rows(self):
+        df = pd.DataFrame(
+            {
+                "city": ["Ottawa-Carleton", None, "Lévis"],
+                "title": ["PDV: Fit-Up;", "RECL", None],
+                "owner": ["Université d'Ottawa", None, "RECL"],
+                "contractor": ["PCL Constructors", "s and r mech", None],
+                "engineer": [None, "Dilfo Mechanical Ltd.", "Frecon"],
+                "address": ["123 Fake St.", "8-1230 marenger street", None],
+            }
+        )
+        expected = pd.concat(
+            [wrangle(row.to_frame().transpose()) for _, row in df.iterrows()]
+        )
+        pd.testing.assert_frame_equal(expected.astype(str), wrangle_rows(df).astype(str))
+
+    def test_wrangle_persisted(self):
+        df = pd.DataFrame(
+            {
+                "city": ["Ottawa-Carleton", "York Region, Town of Markham", "Lévis"],
+                "title": ["PDV: Fit-Up;", " ", "RECL"],
+                "owner": ["Université d'Ottawa", None, "RECL"],
+                "contractor": ["PCL Constructors", "s and r mech", " "],
+                "engineer": [None, "Dilfo Mechanical Ltd.", "Frecon"],
+                "address": ["123 Fake St.", "8-1230 marenger street", None],
+            }
+        )
+        persisted_df = pd.concat([df, get_wrangled_columns(df)], axis=1)
+        self.assertEqual([None, "dilfo", "frecon"], list(persisted_df.wrangled_engineer))
+        persisted_df.loc[2, ["wrangled_city", "wrangler_version"]] = ["stale", 0]
+        persisted_df.loc[1, "wrangled_title"] = "trusted as is"
+        wrangled_df = wrangle(df.copy())
+        wrangled_df.loc[1, "title"] = "trusted as is"
+        wrangled_df.loc[1, "total_string_dump"] = "".join(
+            wrangled_df.loc[1, ["title", "city", "owner", "street_number", "street_name"]]
+        )
+        pd.testing.assert_frame_equal(wrangled_df, wrangle(persisted_df))
+
+    def test_clean_cache_info(self):
+        clear_clean_caches()
+        for _ in range(3):
+            self.assertEqual("pcl", clean_company_name("PCL Constructors"))
+        cache_stats = clean_cache_info()["clean_company_name"]
+        self.assertEqual((2, 1, 1), (cache_stats["hits"], cache_stats["misses"], cache_stats["size"]))
+        self.assertEqual(0.6667, cache_stats["hit_rate"])
+        self.assertIsNone(clean_cache_info()["clean_city"]["hit_rate"])
+
+    def test_series_clean_cache_info(self):
+        clear_clean_caches()
+        raw = pd.Series(["PCL Constructors", "Frecon", "PCL Constructors", None])
+        for _ in range(2):
+            self.assertEqual(
+                ["pcl", "frecon", "pcl", ""],
+                apply_clean_op(raw, clean_company_name).tolist(),
+            )
+        cache_stats = clean_cache_info()["clean_company_name_series"]
+        self.assertEqual((2, 2, 2), (cache_stats["hits"], cache_stats["misses"], cache_stats["size"]))
+        self.assertEqual(1, clean_cache_info()["clean_company_name"]["misses"])  # only `None`
+
+
+@ddt
+class TestMatcherFuncs(unittest.TestCase):
+    @data(
+        (0.3, 0),
+        (0.4, 0),
+        (0.5, 0),
+        (0.5, 1),
+        (0.7, 1),
+    )
+    @unpack
+    def test_predict_matches(self, prob, multi_phase_proned):
+        batch_pred = predict_matches(
+            np.array([prob]), 0.4, np.array([multi_phase_proned]), 0.6
+        )[0]
+        self.assertEqual(predict_match(prob, 0.4, multi_phase_proned, 0.6), batch_pred)
+
+    def test_flag_multi_phase(self):
+        results = pd.DataFrame(
+            {
+                "city": ["ottawa", "kingston", np.nan],
+                "title": ["universityofottawaphase2", "warehouse", "hospital"],
+            }
+        )
+        self.assertEqual([1, 0, 1], list(flag_multi_phase(results)))
+
+    def test_load_artifact_hot_reload(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rf_features.pkl")
+            with open(path, "wb") as output:
+                pickle.dump(["city_score", "title_score"], output)
+            features = load_artifact(path)
+            self.assertEqual(["city_score", "title_score"], features)
+            self.assertIs(features, load_artifact(path))  # not unpickled again
+            new_path = os.path.join(tmp_dir, "new_rf_features.pkl")
+            with open(new_path, "wb") as output:
+                pickle.dump(["city_score"], output)
+            os.rename(new_path, path)  # how `ml.validate_model` swaps models in
+            self.assertEqual(["city_score"], load_artifact(path))
+
+    def test_get_cert_id_checks(self):
+        company_projects = pd.DataFrame(
+            {"project_id": [1, 2, 3, 4], "last_cert_id_check": [None, 5, 9, 12]}
+        )
+        df_web = pd.DataFrame({"cert_id": [6, 9, 8]})
+        self.assertEqual({1: 9, 2: 9}, get_cert_id_checks(company_projects, df_web))
+        self.assertEqual({}, get_cert_id_checks(company_projects, df_web.iloc[:0]))
+
+    def test_match_workers(self):
+        company_projects = pd.DataFrame(
+            {
+                "project_id": [1, 2, 3],
+                "job_number": ["2414", "2415", "2416"],
+                "city": ["Ottawa", "Kingston", "Toronto"],
+                "address": ["125 Sparks Street", "12 Carrière Rd", "6250 st albans court"],
+                "title": ["Library Roof Repair", "School Addition", "Lab Fit-Up"],
+                "owner": ["PWGSC", "Limestone DSB", "Ontario Power Generation"],
+                "contractor": ["Pomerleau", "Frecon", "Dilfo Mechanical Ltd."],
+                "engineer": ["J.L. Richards", None, "WSP"],
+                "address_lat": [45.4226, 44.2312, np.nan],
+                "address_lng": [-75.6985, -76.4860, np.nan],
+                "city_lat": [45.2502, 44.2312, 43.6532],
+                "city_lng": [-75.8003, -76.4860, -79.3832],
+                "city_size": [0.64, 0.12, 0.60],
+                "last_cert_id_check": [np.nan, np.nan, np.nan],
+            }
+        )
+        df_web = company_projects.drop(columns=["project_id", "job_number"]).iloc[[2, 0, 1, 0]]
+        df_web["title"] = ["Fit-up", "Roof Repairs", "Warehouse", "Library"]
+        df_web["cert_id"] = [11, 12, 13, 14]
+        df_web["url_key"] = ["a", "b", "c", "d"]
+        df_web["pub_date"] = "2019-05-24"
+        df_web["source"] = "dcn"
+        features = ["contractor_score", "title_score", "city_score", "geocode_proximity_score"]
+        rng = np.random.RandomState(0)
+        clf = RandomForestClassifier(n_estimators=5, random_state=42).fit(
+            rng.randint(0, 100, size=(50, len(features))), rng.randint(0, 2, size=50)
+        )
+        for artifact, obj in [("model", clf), ("features", features)]:
+            path = f"./test_workers_rf_{artifact}.pkl"
+            self.addCleanup(os.remove, path)
+            with open(path, "wb") as output:
+                pickle.dump(obj, output)
+        with mock.patch("matcher.update_results"):
+            serial, parallel = [
+                match(
+                    company_projects=company_projects.copy(),
+                    df_web=df_web.copy(),
+                    test=True,
+                    version="test_workers",
+                    workers=workers,
+                )
+                for workers in [1, 2]
+            ]
+        self.assertEqual(12, len(serial))
+        pd.testing.assert_frame_equal(serial, parallel)
+        self.assertEqual([], score_candidates_parallel(company_projects.iloc[:0], df_web, 2))
+
+    def test_match_new_certs_none(self):
+        with mock.patch("matcher.create_connection") as create_connection_mock:
+            self.assertFalse(match_new_certs([], test=True))
+        create_connection_mock.assert_not_called()
+
+    @data(
+        ({"threshold": 0.3, "version": prefilter_version}, 0.3),
+        ({"threshold": 0.3, "version": "0.0"}, None),
+        ({"threshold": 0.3}, None),
+        (None, None),
+    )
+    @unpack
+    def test_load_prefilter_thresh(self, calibration, prefilter_thresh):
+        with mock.patch("matcher.load_latest_recorded", return_value=calibration):
+            self.assertEqual(prefilter_thresh, load_prefilter_thresh())
+
+
+@ddt
+class TestScorerFuncs(unittest.TestCase):
+    @data("full", "partial")
+    def test_attr_score_matrix(self, match_style):
+        web_strs = ["pclconstructors", "pcl", "", " ", "nan", np.nan, None, 5, "PCL"]
+        company_strs = ["pclconstructorsinc", "", np.nan, None, 5, "ellisdon"]
+        scores = attr_score_matrix(web_strs, company_strs, match_style=match_style)
+        for web_i, web_str in enumerate(web_strs):
+            for company_i, company_str in enumerate(company_strs):
+                self.assertEqual(
+                    attr_score(web_str, company_str, match_style=match_style),
+                    scores[web_i, company_i],
+                )
+
+    def test_attr_scores_dedupe(self):
+        web_strs = ["pcl", "ellisdon", "pcl", np.nan, "", "pcl", None, "ellisdon"]
+        score_cache.clear()
+        for _ in range(2):  # second round is served from cache
+            self.assertEqual(
+                list(attr_scores(web_strs, "pclconstructors", dedupe=False)),
+                list(attr_scores(web_strs, "pclconstructors", cache_size=2)),
+            )
+        self.assertEqual(2, len(score_cache))
+        attr_scores(web_strs, None, cache_size=10)  # missing values never hit, so aren't cached
+        self.assertEqual(2, len(score_cache))
+
+    @data(
+        ("multiply", [0.8, 0]),
+        ("add", [2.4, 1.0]),
+    )
+    @unpack
+    def test_compile_score(self, style, desired_scores):
+        scores_df = pd.DataFrame(
+            {"city_score": [100, 0], "owner_score": [60, 50], "title_score": [80, 50]}
+        )
+        total_scores = compile_score(scores_df, ["city", "owner", "title"], style)
+        self.assertEqual(desired_scores, [round(x, 6) for x in total_scores])
+
+    def test_geocode_proximity_score(self):
+        lat = np.array([45.0, 45.3, np.nan])
+        lng = np.array([-75.0, -75.4, -75.0])
+        proximities = geocode_proximity_score(lat, lng, 45, -75)
+        self.assertEqual([0, 0.5, 1], [round(x, 6) for x in proximities])
+        distances = great_circle_distance_score(lat, lng, 45, -75)
+        self.assertAlmostEqual(0, distances[0])
+        self.assertAlmostEqual(45.8, distances[1], delta=0.1)
+        self.assertAlmostEqual(111.2, distances[2])
+
+    def test_get_required_features(self):
+        self.assertEqual(14, len(get_required_features()))
+        self.assertIn("great_circle_distance_score", get_required_features(great_circle=True))
+        self.assertEqual(
+            ["city_pr_score", "geocode_proximity_score"],
+            get_required_features(["geocode_proximity_score", "city_pr_score", "title_length"]),
+        )
+        self.assertEqual(
+            [
+                "contractor_score",
+                "street_name_score",
+                "street_number_score",
+                "title_score",
+                "city_score",
+                "owner_score",
+                "total_score",
+            ],
+            get_required_features(["total_score"]),
+        )
+
+    def test_score_pairs(self):
+        company_project = pd.Series(
+            {"job_number": "2991", "city": "ottawa", "owner": "cityofottawa"}
+        )
+        web_df = pd.DataFrame(
+            {"cert_id": [7, 8], "city": ["ottawa", "toronto"], "owner": ["cityofottawa", ""]}
+        )
+        features = ["city_score", "owner_pr_score"]
+        pairs = concat_scored_pairs(
+            [score_pairs(company_project, web_df, project_pos=i, features=features) for i in range(2)]
+        )
+        self.assertEqual((4, 2), pairs.features.shape)
+        self.assertEqual(np.float32, pairs.features.dtype)
+        self.assertEqual([0, 0, 1, 1], list(pairs.project_pos))
+        self.assertEqual([0, 1, 0, 1], list(pairs.cert_pos))
+        self.assertEqual([100, 0], list(pairs.get_matrix(["owner_pr_score"])[:2, 0]))
+        results = pairs.take([1]).to_frame(pd.DataFrame([company_project]), web_df)
+        self.assertEqual([8], list(results.cert_id))
+        self.assertEqual(["2991"], list(results.job_number))
+        self.assertEqual(pairs.features[1, 0], results.city_score.iloc[0])
+
+    def test_score_cross_pairs(self):
+        company_projects = pd.DataFrame(
+            {
+                "city": ["ottawa", None, "ottawa"],
+                "owner": ["cityofottawa", "pcl", "ottawa"],
+                "address_lat": [45.42, np.nan, 45.35],
+                "address_lng": [-75.69, np.nan, -75.75],
+            }
+        )
+        web_df = pd.DataFrame(
+            {
+                "city": ["ottawa", "toronto", np.nan, "ottawa"],
+                "owner": ["cityofottawa", "", "pcl", "universityofottawa"],
+                "address_lat": [45.42, 43.65, np.nan, 45.40],
+                "address_lng": [-75.69, -79.38, np.nan, -75.70],
+            }
+        )
+        features = ["city_score", "owner_pr_score", "geocode_proximity_score"]
+        pairs = score_cross_pairs(company_projects, web_df, features=features)
+        expected = concat_scored_pairs(
+            [
+                score_pairs(row, web_df, project_pos=i, features=features)
+                for i, row in company_projects.iterrows()
+            ]
+        )
+        np.testing.assert_array_equal(expected.features, pairs.features)
+        np.testing.assert_array_equal(expected.project_pos, pairs.project_pos)
+        np.testing.assert_array_equal(expected.cert_pos, pairs.cert_pos)
+
+    def test_prefilter_score(self):
+        web_df = pd.DataFrame(
+            {
+                "contractor": ["pcl", "ellisdon", "ellisdon"],
+                "address_lat": [46.0, 45.4215, np.nan],  # far away, same spot, unknown
+                "address_lng": [-80.0, -75.6972, np.nan],
+            }
+        )
+        project = pd.Series({"contractor": "pcl", "address_lat": 45.4215, "address_lng": -75.6972})
+        self.assertEqual([1, 1, 0.18], prefilter_score(project, web_df).tolist())
+        project[["address_lat", "address_lng"]] = np.nan
+        self.assertEqual([1, 0.18, 0.18], prefilter_score(project, web_df).tolist())
+        self.assertEqual(0, len(prefilter_score(project, web_df.iloc[:0])))
+
+    @data(None, np.nan)
+    def test_get_fresh_certs_never_checked(self, last_cert_id_check):
+        web_df = pd.DataFrame({"cert_id": [3, 7, 9]})
+        project = pd.Series({"project_id": 1, "last_cert_id_check": last_cert_id_check})
+        self.assertEqual([3, 7, 9], list(get_fresh_certs(project, web_df).cert_id))
+
+    def test_get_fresh_certs(self):
+        web_df = pd.DataFrame({"cert_id": [3, 7, 9]})
+        project = pd.Series({"project_id": 1, "last_cert_id_check": 7.0})
+        self.assertEqual([9], list(get_fresh_certs(project, web_df).cert_id))
+
+    def test_record_cert_id_checks(self):
+        with mock.patch("scorer.create_connection") as create_connection_mock:
+            record_cert_id_checks({})
+            create_connection_mock.assert_not_called()
+            record_cert_id_checks({np.int64(4): np.int64(120), 2: 118.0})
+        conn = create_connection_mock.return_value.__enter__.return_value
+        query, params = conn.cursor.return_value.execute.call_args[0]
+        self.assertEqual(
+            "UPDATE company_projects SET last_cert_id_check = CASE project_id "
+            "WHEN %s THEN %s WHEN %s THEN %s END WHERE project_id IN (%s,%s)",
+            " ".join(query.split()),
+        )
+        self.assertEqual([4, 120, 2, 118, 4, 2], params)
+        self.assertTrue(all(type(param) == int for param in params))
+        conn.commit.assert_called_once()
+
+
+class TestBlocker(unittest.TestCase):
+    def test_geo_grid_index(self):
+        web_df = pd.DataFrame(
+            {
+                "cert_id": [1, 2, 3, 4, 5],
+                "address_lat": [45.42, 45.35, 43.65, np.nan, np.nan],
+                "address_lng": [-75.69, -75.75, -79.38, np.nan, np.nan],
+                "city_lat": [np.nan, np.nan, np.nan, 44.23, np.nan],
+                "city_lng": [np.nan, np.nan, np.nan, -76.48, np.nan],
+            }
+        )  # Ottawa, Nepean, Toronto, Kingston (city only), unknown
+        geo_index = GeoGridIndex(web_df, radius_km=50)
+        ottawa_project = pd.Series({"address_lat": 45.40, "address_lng": -75.70})
+        self.assertEqual([1, 2, 5], list(geo_index.query(ottawa_project).cert_id))
+        kingston_project = pd.Series(
+            {"address_lat": np.nan, "address_lng": np.nan, "city_lat": 44.25, "city_lng": -76.5}
+        )
+        self.assertEqual([4, 5], list(geo_index.query(kingston_project).cert_id))
+        unknown_project = pd.Series({"address_lat": np.nan, "address_lng": np.nan})
+        self.assertEqual(5, len(geo_index.query(unknown_project)))
+
+    def test_token_index(self):
+        company_projects = wrangle(
+            pd.DataFrame(
+                {
+                    "city": ["Ottawa", "Kingston", "Toronto"],
+                    "address": ["123 Fake St.", "12 Carrière Rd", "6250 st albans court"],
+                    "title": ["Warehouse", "School Addition", "Lab Fit-Up"],
+                    "owner": ["City of Ottawa", "Limestone DSB", "Ontario Power Generation"],
+                    "contractor": ["PCL Constructors", "Frecon", "Dilfo Mechanical Ltd."],
+                }
+            )
+        )
+        token_index = TokenIndex(company_projects)
+        web_row = wrangle(
+            pd.DataFrame(
+                {
+                    "city": ["Toronto, Ontario"],
+                    "address": ["12 Carriere Road"],
+                    "title": ["Fit-up"],
+                    "owner": ["OPG"],
+                    "contractor": ["Dilfo HVAC Services Inc"],
+                }
+            )
+        ).iloc[0]
+        self.assertEqual([1, 2], token_index.query(web_row))
+        token_index.remove(2)
+        self.assertEqual([1], token_index.query(web_row))
+
+
+class TestForest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.randint(0, 100, size=(200, 3)).astype(float)
+        self.y = (self.X[:, 0] + rng.randint(0, 30, size=200) > 70).astype(int)
+        self.clf = RandomForestClassifier(n_estimators=5, random_state=42).fit(self.X, self.y)
+
+    def test_flatten_forest(self):
+        flat = flatten_forest(self.clf)
+        trees = [estimator.tree_ for estimator in self.clf.estimators_]
+        self.assertEqual(sum(tree.node_count for tree in trees), len(flat["threshold"]))
+        self.assertEqual(trees[0].node_count, flat["roots"][1])
+        root = flat["roots"][2]
+        self.assertEqual(trees[2].children_left[0] + root, flat["children_left"][root])
+        is_leaf = flat["children_left"] == -1
+        np.testing.assert_allclose(1, flat["value"][is_leaf].sum(axis=1))
+
+    def test_predict_forest_proba(self):
+        flat = flatten_forest(self.clf)
+        X = np.vstack([self.X, [[0, 0, 0], [100, 100, 100], [70.5, 12, 99]]])
+        np.testing.assert_allclose(self.clf.predict_proba(X), predict_forest_proba(flat, X))
+        np.testing.assert_allclose(
+            self.clf.predict_proba(X[:1]), predict_forest_proba(flat, X[:1], batch_size=1)
+        )
+        with self.assertRaises(ValueError):
+            predict_forest_proba(flat, X[:, :2])
+        with self.assertRaises(ValueError):
+            predict_forest_proba(flat, [[0, np.nan, 0]])
+
+    def test_flat_forest_matches(self):
+        other_clf = RandomForestClassifier(n_estimators=5, random_state=0).fit(self.X, self.y)
+        flat = flatten_forest(self.clf)
+        self.assertTrue(flat_forest_matches(flat, self.clf))
+        self.assertFalse(flat_forest_matches(flat, other_clf))
+        self.assertFalse(flat_forest_matches(dict(flat, version=np.int32(1)), self.clf))
+        self.assertFalse(
+            flat_forest_matches({k: v for k, v in flat.items() if k != "fingerprint"}, self.clf)
+        )
+
+    def test_predict_model_proba_mismatched_forest(self):
+        other_clf = RandomForestClassifier(n_estimators=5, random_state=0).fit(self.X, self.y)
+        for path in ["./test_forest_rf_model.pkl", "./test_forest_rf_forest.pkl"]:
+            self.addCleanup(os.remove, path)
+        with open("./test_forest_rf_model.pkl", "wb") as output:
+            pickle.dump(self.clf, output)
+        joblib.dump(flatten_forest(other_clf), "./test_forest_rf_forest.pkl")
+        np.testing.assert_array_equal(  # stale trees of another model are never used
+            self.clf.predict_proba(self.X),
+            predict_model_proba(self.X, version="test_forest", backend="flat"),
+        )
+
 
 @ddt
 class InputTests(unittest.TestCase):
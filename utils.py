@@ -7,6 +7,8 @@ import logging
 import json
 import datetime
 import argparse
+import time
+from contextlib import contextmanager
 import mysql.connector
 
 
@@ -51,6 +53,15 @@ def load_last_recorded(key):
     return results[last_recorded_date][key]
 
 
+def load_latest_recorded(key):
+    """Returns most recently recorded value of input `key`, even if it wasn't recorded on
+    the last recorded date. Returns `None` if `key` was never recorded."""
+    results = load_results()
+    for recorded_date in sorted(results.keys(), reverse=True):
+        if isinstance(results[recorded_date], dict) and key in results[recorded_date]:
+            return results[recorded_date][key]
+
+
 def update_results(new_results):
     """Updates `results.json` by updating dictionary located at key for today's date with whatever
     dictionary is passed in."""
@@ -64,6 +75,75 @@ def update_results(new_results):
         json.dump(results, f, sort_keys=True, indent=2)  
 
 
+profiling_on = False
+profile_stats = {}  # op name -> {"calls": int, "rows": int, "seconds": float}
+
+
+def enable_profiling(enabled=True):
+    """Turns recording of `profile` timings on (or off) for the current process."""
+    global profiling_on
+    profiling_on = enabled
+
+
+def profiling_enabled():
+    """Returns whether `profile` timings are currently being recorded."""
+    return profiling_on
+
+
+@contextmanager
+def profile(op, rows=0):
+    """Context manager recording wall time of the enclosed block under name `op` in
+    `profile_stats`, along with the number of `rows` it processed. Does nothing unless
+    profiling was turned on with `enable_profiling`.
+
+    Typical usage pattern is as follows:
+    with profile("wrangle/city", len(df)):
+        df["city"] = df["city"].apply(clean_city)
+
+    """
+    start = time.perf_counter()
+    yield
+    if profiling_on:
+        stats = profile_stats.setdefault(op, {"calls": 0, "rows": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["rows"] += rows
+        stats["seconds"] += time.perf_counter() - start
+
+
+def pop_profile_stats():
+    """Returns recorded profile stats and starts over, e.g. to send them from a worker
+    process back to the main one (see `merge_profile_stats`)."""
+    stats = {op: dict(op_stats) for op, op_stats in profile_stats.items()}
+    profile_stats.clear()
+    return stats
+
+
+def merge_profile_stats(stats):
+    """Adds profile stats recorded elsewhere (see `pop_profile_stats`) to this process'."""
+    for op, op_stats in stats.items():
+        own_stats = profile_stats.setdefault(op, {"calls": 0, "rows": 0, "seconds": 0.0})
+        for key in own_stats:
+            own_stats[key] += op_stats[key]
+
+
+def record_profile_stats():
+    """Logs recorded profile stats, slowest ops first, and saves them to `results.json`
+    under `profile` through `update_results`. Recorded stats are reset afterwards."""
+    stats = pop_profile_stats()
+    for op, op_stats in sorted(stats.items(), key=lambda x: -x[1]["seconds"]):
+        op_stats["seconds"] = round(op_stats["seconds"], 4)
+        op_stats["us_per_row"] = (
+            round(op_stats["seconds"] * 1e6 / op_stats["rows"], 3)
+            if op_stats["rows"]
+            else None
+        )
+        logger.info(
+            f"{op}: {op_stats['seconds']}s over {op_stats['calls']} calls and "
+            f"{op_stats['rows']} rows"
+        )
+    update_results({"profile": stats})
+
+
 def save_config(config):
     """Saves updated `config` object to file as `cert_config.yml` use in conjunction with
     load_config()"""
@@ -1,7 +1,105 @@
 import pandas as pd
+import numpy as np
 from cleanco import cleanco
 import unidecode
 import re
+import json
+import argparse
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from utils import create_connection, profile, load_config
+
+
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s - %(funcName)s "
+        "- line %(lineno)d"
+    )
+)
+logger.addHandler(log_handler)
+logger.setLevel(logging.INFO)
+
+
+clean_cache_size = load_config()["wrangler"]["clean_cache_size"]
+
+city_saint_variants = [" ste ", " ste. ", " ste-", " st ", " saint ", " sainte ", " st-"]
+city_filler_words = [
+    "city",
+    "county",
+    "municipality",
+    "district",
+    "ward",
+    "township",
+    "greater",
+    "region",
+]
+company_filler_words = [
+    "constructor",
+    "construction",
+    "contracting",
+    "contractor",
+    "mechanical",
+    "plumbing",
+    "heating",
+    "mech",
+    "electrical",
+    "electric",
+    "development",
+    "interior" "builders",
+    "building",
+    "enterprise",
+    "infrastructure",
+    "management",
+    "excavating",
+    "trucking",
+    "company",
+    "restoration",
+    "service",
+    "servicing",
+    "hvac",
+    "system",
+    "paving",
+    "industrie",
+    "industry",
+    "engineering",
+    "consulting",
+    "consultant",
+    "solution",
+    "commercial",
+    "group",
+    "insulation",
+    "insulators",
+    "ontario",
+    "canada",
+]
+company_stopwords = ["of", "d'", "l'"]
+apartment_prefixes = ["apt ", "apt. ", "apartment ", "unit ", "suite "]
+saint_prefixes = ["st ", "st. ", "saint ", "st-", "saint-"]
+
+
+def strip_words(string, words, replacement=""):
+    """Replaces every occurrence of each of `words` in `string` by `replacement`, one word
+    after the other in list order, e.g. so that "mech" can't be stripped out of
+    "mechanical" if "mechanical" comes first. Shared by city and company name cleaning, and
+    mapped once over a whole column by their vectorized counterparts.
+
+    Parameters:
+    `string` (str): string to strip words from.
+    `words` (list): words to strip, in order of priority.
+    `replacement` (str): what to replace each word with.
+
+    Returns:
+    The stripped string.
+
+    """
+    for word in words:
+        string = string.replace(word, replacement)
+    return string
 
 
 def clean_job_number(raw):
@@ -23,13 +121,13 @@ def clean_pub_date(raw):
         return ""
 
 
+@lru_cache(maxsize=clean_cache_size)
 def clean_city(raw):
     if raw == " ":
         return ""
     raw = unidecode.unidecode(raw)
     city = raw.lower()
-    for variant in [" ste ", " ste. ", " ste-", " st ", " saint ", " sainte ", " st-"]:
-        city = city.replace(variant, " st ")
+    city = strip_words(city, city_saint_variants, " st ")
     city = city.replace("of the ", "")
     if "of " in city:
         city = city.split("of ")[1]
@@ -39,17 +137,7 @@ def clean_city(raw):
         if sep in city:
             city = city.split(sep)[0]
     city = city.replace("-", " ")
-    for word in [
-        "city",
-        "county",
-        "municipality",
-        "district",
-        "ward",
-        "township",
-        "greater",
-        "region",
-    ]:
-        city = city.replace(word, " ")
+    city = strip_words(city, city_filler_words, " ")
     city = city.rstrip(" ").lstrip(" ")
     if city.endswith(" on", -3):
         city = city[:-3]
@@ -62,6 +150,7 @@ def clean_city(raw):
     return city
 
 
+@lru_cache(maxsize=clean_cache_size)
 def clean_company_name(raw):
     if raw in (" ", "None", None):
         return ""
@@ -80,8 +169,7 @@ def clean_company_name(raw):
         pass
     name = cleanco(name).clean_name()
     name = name.lower()
-    for stopword in ["of", "d'", "l'"]:
-        name = name.replace(stopword, "")
+    name = strip_words(name, company_stopwords)
     name = name.replace("and", "&")
     for punct in ["-", ".", ",", "(", ")"]:
         name = name.replace(punct, " ")
@@ -90,46 +178,7 @@ def clean_company_name(raw):
     if (not name.startswith("s ")) and (not " s " in name):
         name = " ".join([word.rstrip("s") for word in name.split(" ")])
     name = "".join([word for word in name.split(" ")])
-    for word in [
-        "constructor",
-        "construction",
-        "contracting",
-        "contractor",
-        "mechanical",
-        "plumbing",
-        "heating",
-        "mech",
-        "electrical",
-        "electric",
-        "development",
-        "interior" "builders",
-        "building",
-        "enterprise",
-        "infrastructure",
-        "management",
-        "excavating",
-        "trucking",
-        "company",
-        "restoration",
-        "service",
-        "servicing",
-        "hvac",
-        "system",
-        "paving",
-        "industrie",
-        "industry",
-        "engineering",
-        "consulting",
-        "consultant",
-        "solution",
-        "commercial",
-        "group",
-        "insulation",
-        "insulators",
-        "ontario",
-        "canada",
-    ]:
-        name = name.replace(word, "")
+    name = strip_words(name, company_filler_words)
     return name
 
 
@@ -138,6 +187,7 @@ def get_acronyms(raw):
     return acronyms
 
 
+@lru_cache(maxsize=clean_cache_size)
 def get_street_number(raw):
     if raw == " ":
         return ""
@@ -152,6 +202,7 @@ def get_street_number(raw):
         return ""
 
 
+@lru_cache(maxsize=clean_cache_size)
 def get_street_name(raw):
     if raw == " " or (raw == None):
         return ""
@@ -163,13 +214,13 @@ def get_street_name(raw):
         return ""
     rest = re.findall(f"{num} (.*)", raw)[0]
     if any(
-        [rest.startswith(x) for x in ["apt ", "apt. ", "apartment ", "unit ", "suite "]]
+        [rest.startswith(x) for x in apartment_prefixes]
     ):
         if "," in rest:
             rest = rest.split(",")[1].lstrip(" ")
         else:
             return ""
-    for saint_word in ["st ", "st. ", "saint ", "st-", "saint-"]:
+    for saint_word in saint_prefixes:
         if rest.startswith(saint_word):
             rest = rest.replace(saint_word, "")
             break
@@ -185,6 +236,7 @@ def get_street_name(raw):
         return ""
 
 
+@lru_cache(maxsize=clean_cache_size)
 def clean_title(raw):
     if raw == " ":
         return ""
@@ -195,6 +247,67 @@ def clean_title(raw):
     return title
 
 
+cached_clean_funcs = (
+    clean_city,
+    clean_company_name,
+    get_street_number,
+    get_street_name,
+    clean_title,
+)
+# memoized cleaning function -> cache of unique strings cleaned by its vectorized
+# counterpart (see `clean_uniques`), as raw -> cleaned value ordered from least to most
+# recently used, along with its hit and miss counts
+series_clean_caches = {
+    func: {"cache": OrderedDict(), "hits": 0, "misses": 0} for func in cached_clean_funcs
+}
+series_clean_lock = threading.Lock()  # `wrangle` runs in threaded Flask request handlers
+
+
+def get_cache_stats(hits, misses, size, max_size):
+    """Returns stats of a cache as reported by `clean_cache_info`."""
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "size": size,
+        "max_size": max_size,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def clean_cache_info():
+    """Returns hits, misses, current size, max size and hit rate of the memoized cleaning
+    functions' caches, keyed by function name. Caches of their vectorized counterparts,
+    which `wrangle` goes through by default, are keyed by the vectorized function's name
+    (e.g. `clean_city_series`)."""
+    stats = {}
+    for func in cached_clean_funcs:
+        info = func.cache_info()
+        stats[func.__name__] = get_cache_stats(
+            info.hits, info.misses, info.currsize, info.maxsize
+        )
+    with series_clean_lock:
+        for func, series_cache in series_clean_caches.items():
+            stats[vectorized_clean_ops[func].__name__] = get_cache_stats(
+                series_cache["hits"],
+                series_cache["misses"],
+                len(series_cache["cache"]),
+                clean_cache_size,
+            )
+    return stats
+
+
+def clear_clean_caches():
+    """Empties the memoized cleaning functions' caches, as well as the ones of their
+    vectorized counterparts, and resets their stats."""
+    for func in cached_clean_funcs:
+        func.cache_clear()
+    with series_clean_lock:
+        for series_cache in series_clean_caches.values():
+            series_cache["cache"].clear()
+            series_cache["hits"] = series_cache["misses"] = 0
+
+
 def concat_all_fields(row):
     return "".join(
         [
@@ -211,13 +324,358 @@ def concat_all_fields(row):
     )
 
 
-def wrangle(df):
+street_number_pattern = re.compile(r" ?(\d+) \w")
+alias_patterns = [
+    re.compile(pattern, flags=re.I) for pattern in ("o/a (.*)", "c/o (.*)", "(.*) for ")
+]
+acronym_pattern = re.compile(r"[A-Z\-\&]{3,}")
+pub_date_pattern = re.compile(r"(\d{4}\-\d{2}\-\d{2})")
+title_stop_pattern = re.compile(r"[ :\-;.']")
+company_punct_pattern = re.compile(r"[\-.,()]")
+trailing_s_pattern = re.compile(r"s+(?= |\Z)")
+trailing_apostrophe_s_pattern = re.compile(r"['s]+(?= |\Z)")
+
+
+def unidecode_series(series):
+    """Applies `unidecode` to non-ASCII strings of `series` only, since it leaves ASCII
+    strings unchanged."""
+    non_ascii = ~series.map(str.isascii).astype(bool)
+    if non_ascii.any():
+        series = series.copy()
+        series[non_ascii] = series[non_ascii].map(unidecode.unidecode)
+    return series
+
+
+def clean_job_number_series(raw):
+    return raw.str.replace(r"\W+", "", regex=True)
+
+
+def clean_pub_date_series(raw):
+    return raw.str.extract(pub_date_pattern, expand=False).fillna("")
+
+
+def clean_city_series(raw):
+    city = unidecode_series(raw).str.lower()
+    city = city.map(partial(strip_words, words=city_saint_variants, replacement=" st "))
+    city = city.str.replace("of the ", "", regex=False)
+    city = city.where(~city.str.contains("of ", regex=False), city.str.split("of ").str[1])
+    in_county = city.str.contains("county, ", regex=False) & ~city.str.contains(
+        "county, on", regex=False
+    )
+    city = city.where(~in_county, city.str.split("county, ").str[1])
+    for sep in (",", " - "):
+        city = city.str.split(sep, n=1).str[0]
+    city = city.str.replace("-", " ", regex=False)
+    city = city.map(partial(strip_words, words=city_filler_words, replacement=" "))
+    city = city.str.strip(" ")
+    ends_with_on = city.str.endswith(" on")
+    has_ontario = ~ends_with_on & city.str.contains("ontario", regex=False)
+    city[ends_with_on] = city[ends_with_on].str[:-3]
+    city[has_ontario] = city[has_ontario].str.strip("ontario")
+    city = city.str.replace(trailing_apostrophe_s_pattern, "", regex=True)
+    city = city.str.replace(" ", "", regex=False).str.replace("/", "&", regex=False)
+    city[city == "ottawacarleton"] = "ottawa"
+    city[raw == " "] = ""
+    return city
+
+
+def clean_company_name_series(raw):
+    name = unidecode_series(raw)
+    for pattern in alias_patterns:
+        name = name.str.extract(pattern, expand=False).fillna(name)
+    name = name.map(lambda x: cleanco(x).clean_name()).str.lower()
+    name = name.map(partial(strip_words, words=company_stopwords))
+    name = name.str.replace("and", "&", regex=False)
+    name = name.str.replace(company_punct_pattern, " ", regex=True)
+    name = name.str.replace("'", "", regex=False)
+    plural = ~name.str.startswith("s ") & ~name.str.contains(" s ", regex=False)
+    name[plural] = name[plural].str.replace(trailing_s_pattern, "", regex=True)
+    name = name.str.replace(" ", "", regex=False)
+    name = name.map(partial(strip_words, words=company_filler_words))
+    name[raw.isin([" ", "None"])] = ""
+    return name
+
+
+def clean_title_series(raw):
+    title = unidecode_series(raw).str.lower().str.replace(title_stop_pattern, "", regex=True)
+    title[raw == " "] = ""
+    return title
+
+
+def get_street_number_series(raw):
+    number = raw.str.findall(street_number_pattern).str[-1].fillna("")
+    number[raw == " "] = ""
+    return number
+
+
+def get_street_name_series(raw):
+    address = unidecode_series(raw.str.lower())
+    num = address.str.findall(street_number_pattern).str[-1]
+    has_num = num.notna() & (raw != " ")
+    rest = pd.Series(
+        [
+            x[x.find(f"{n} ") + len(n) + 1 :].split("\n")[0]
+            for x, n in zip(address[has_num], num[has_num])
+        ],
+        index=address.index[has_num],
+        dtype=object,
+    )
+    in_apartment = rest.str.startswith(tuple(apartment_prefixes))
+    rest[in_apartment] = rest[in_apartment].str.split(",").str[1].str.lstrip(" ")
+    rest = rest.dropna()  # apartment without a street after it
+    unsaintly = rest[rest.str.startswith(("st", "saint"))]
+    for saint_word in saint_prefixes:
+        saintly = unsaintly.str.startswith(saint_word)
+        rest[saintly.index[saintly]] = unsaintly[saintly].str.replace(saint_word, "", regex=False)
+        unsaintly = unsaintly[~saintly]
+    name = rest.str.split(" ", n=1).str[0]
+    hyphenated = name.str.contains("-", regex=False)
+    name[hyphenated] = rest[hyphenated].str.split("-", n=1).str[0]
+    name[~(name.str.isalpha() | name.str.contains("-", regex=False))] = ""
+    return name.reindex(raw.index, fill_value="")
+
+
+vectorized_clean_ops = {
+    clean_job_number: clean_job_number_series,
+    clean_pub_date: clean_pub_date_series,
+    clean_city: clean_city_series,
+    clean_company_name: clean_company_name_series,
+    get_street_number: get_street_number_series,
+    get_street_name: get_street_name_series,
+    clean_title: clean_title_series,
+}
+
+
+def apply_clean_op(series, clean_op):
+    """Vectorized counterpart of `series.apply(clean_op)`, giving the same result.
+
+    Each unique string of `series` is cleaned once by the matching function in
+    `vectorized_clean_ops`, and other values (`None`, `NaN`, numbers) go through reference
+    function `clean_op` itself, which raises the same errors as it would for `apply`.
+
+    Parameters:
+    `series` (pd.Series): raw values of one column.
+    `clean_op` (function): reference cleaning function for values of that column.
+
+    Returns:
+    A pd.Series of cleaned values sharing the index of `series`.
+
+    """
+    values = series.values.astype(object)
+    is_str = series.map(lambda x: isinstance(x, str)).values.astype(bool)
+    cleaned = np.empty(len(values), dtype=object)
+    cleaned[~is_str] = [clean_op(x) for x in values[~is_str]]
+    if is_str.any():
+        codes, uniques = pd.factorize(values[is_str])
+        cleaned[is_str] = clean_uniques(uniques, clean_op)[codes]
+    return pd.Series(cleaned, index=series.index, name=series.name)
+
+
+def clean_uniques(uniques, clean_op):
+    """Returns cleaned values of unique strings `uniques`, as cleaned by the vectorized
+    counterpart of `clean_op` (see `vectorized_clean_ops`). For memoized cleaning functions,
+    only strings missing from `series_clean_caches` get cleaned, so that values repeated
+    across calls (e.g. cities and contractors of successive chunks) are cleaned once.
+
+    Parameters:
+    `uniques` (np.array): unique raw strings.
+    `clean_op` (function): reference cleaning function for these strings.
+
+    Returns:
+    A numpy array of objects holding cleaned values, in the order of `uniques`.
+
+    """
+    vectorized_clean_op = vectorized_clean_ops[clean_op]
+    if clean_op not in series_clean_caches or not clean_cache_size:
+        return vectorized_clean_op(pd.Series(uniques, dtype=object)).values
+    series_cache = series_clean_caches[clean_op]
+    cache = series_cache["cache"]
+    cleaned = np.empty(len(uniques), dtype=object)
+    misses = []
+    with series_clean_lock:
+        for i, raw in enumerate(uniques):
+            if raw in cache:
+                cleaned[i] = cache[raw]
+                cache.move_to_end(raw)
+            else:
+                misses.append(i)
+        series_cache["hits"] += len(uniques) - len(misses)
+        series_cache["misses"] += len(misses)
+    if misses:
+        cleaned[misses] = vectorized_clean_op(pd.Series(uniques[misses], dtype=object)).values
+        with series_clean_lock:
+            for i in misses:
+                cache[uniques[i]] = cleaned[i]
+            while len(cache) > clean_cache_size:
+                cache.popitem(last=False)
+    return cleaned
+
+
+def concat_all_fields_series(df):
+    """Vectorized counterpart of `df.apply(concat_all_fields, axis=1)`."""
+    total_string_dump = pd.Series("", index=df.index, dtype=object)
+    for attr in ["title", "city", "owner", "street_number", "street_name"]:
+        total_string_dump += df[attr].map(lambda x: "" if x is None else str(x))
+    return total_string_dump
+
+
+clean_ops = {
+    "job_number": clean_job_number,
+    "pub_date": clean_pub_date,
+    "city": clean_city,
+    "title": clean_title,
+    "owner": clean_company_name,
+    "contractor": clean_company_name,
+    "engineer": clean_company_name,
+}
+get_address_ops = {
+    "street_number": get_street_number,
+    "street_name": get_street_name,
+}
+acronym_attrs = ["title", "owner", "contractor"]
+
+wrangler_version = 1  # bump whenever cleaning output changes, to invalidate persisted values
+persisted_attrs = ["city", "title", "owner", "contractor", "engineer", "street_number", "street_name"]
+wrangled_columns = (
+    [f"wrangled_{attr}" for attr in persisted_attrs]
+    + [f"wrangled_{attr}_acronyms" for attr in acronym_attrs]
+    + ["wrangler_version"]
+)
+
+
+def clean_column(raw, clean_op, vectorized, persisted=None):
+    """Cleans `raw` values of a column like `raw.apply(clean_op)` would, except that string
+    values which already have a `persisted` wrangled value (see `get_wrangled_columns`) are
+    taken from it instead of being cleaned all over again.
+
+    Parameters:
+    `raw` (pd.Series): raw values of one column.
+    `clean_op` (function): cleaning function for values of that column.
+    `vectorized` (bool): whether to clean through `apply_clean_op` rather than `apply`.
+    `persisted` (pd.Series): previously wrangled values of `raw`, `None` where unavailable.
+
+    Returns:
+    A pd.Series of cleaned values sharing the index of `raw`.
+
+    """
+    todo = None if persisted is None else persisted.isna().values
+    if todo is not None and not todo.all():
+        todo |= ~raw.map(lambda x: isinstance(x, str)).values.astype(bool)
+    if todo is None or todo.all():
+        return apply_clean_op(raw, clean_op) if vectorized else raw.apply(clean_op)
+    cleaned = persisted.values.astype(object)
+    if todo.any():
+        raw = raw[todo]
+        cleaned[todo] = (apply_clean_op(raw, clean_op) if vectorized else raw.apply(clean_op)).values
+    return pd.Series(cleaned, index=persisted.index, name=raw.name)
+
+
+def get_wrangled_columns(df):
+    """Wrangles text columns of raw `df` one value at a time, to be persisted alongside raw
+    columns of `web_certificates` and `company_projects` and picked up by `wrangle` rather
+    than cleaned all over again.
+
+    Parameters:
+    `df` (pd.DataFrame): raw certificates or company projects, as they're being inserted.
+
+    Returns:
+    A pd.DataFrame holding `wrangled_columns` and sharing the index of `df`. Values which
+    can't be cleaned on their own (e.g. `NULL` cities) are left as `None`, and acronyms are
+    JSON lists.
+
+    """
+    wrangled = pd.DataFrame(index=df.index)
+    address = df["address"].astype("str")
+    for attr in persisted_attrs:
+        if attr in get_address_ops:
+            raw = address
+        else:
+            raw = df[attr] if attr in df else pd.Series(None, index=df.index, dtype=object)
+        is_str = raw.map(lambda x: isinstance(x, str)).values.astype(bool)
+        cleaned = np.full(len(df), None, dtype=object)
+        if is_str.any():
+            clean_op = get_address_ops.get(attr, clean_ops.get(attr))
+            cleaned[is_str] = apply_clean_op(raw[is_str], clean_op).values
+        wrangled[f"wrangled_{attr}"] = cleaned
+    for attr in acronym_attrs:
+        wrangled[f"wrangled_{attr}_acronyms"] = [
+            None if x is None else json.dumps(get_acronyms(x))
+            for x in wrangled[f"wrangled_{attr}"]
+        ]
+    wrangled["wrangler_version"] = pd.Series(wrangler_version, index=df.index, dtype=object)
+    return wrangled
+
+
+def add_wrangled_columns(table_name):
+    """Adds `wrangled_columns` to table `table_name` (`web_certificates` or
+    `company_projects`) if they're not there yet."""
+    with create_connection() as conn:
+        existing_cols = set(pd.read_sql(f"SHOW COLUMNS FROM {table_name}", conn).Field)
+        missing_cols = [col for col in wrangled_columns if col not in existing_cols]
+        if missing_cols:
+            conn.cursor().execute(
+                f"ALTER TABLE {table_name} "
+                + ", ".join(
+                    f"ADD COLUMN {col} {'INTEGER' if col == 'wrangler_version' else 'TEXT'}"
+                    for col in missing_cols
+                )
+            )
+            conn.commit()
+
+
+def backfill_wrangled_columns(table_name, batch_size=10000):
+    """Fills in `wrangled_columns` of all rows of table `table_name` (`web_certificates` or
+    `company_projects`) that were never wrangled or were wrangled by an older
+    `wrangler_version`, `batch_size` rows at a time.
+
+    Returns:
+    Number of rows that got wrangled.
+
+    """
+    add_wrangled_columns(table_name)
+    key = {"web_certificates": "cert_id", "company_projects": "project_id"}[table_name]
+    stale_query = f"""
+        SELECT *
+        FROM {table_name}
+        WHERE (wrangler_version IS NULL OR wrangler_version<>%s) AND {key}>%s
+        ORDER BY {key}
+        LIMIT %s
+    """
+    update_query = f"""
+        UPDATE {table_name}
+        SET {', '.join(f'{col}=%s' for col in wrangled_columns)}
+        WHERE {key}=%s
+    """
+    last_key, total = -1, 0
+    while True:
+        with create_connection() as conn:
+            rows = pd.read_sql(stale_query, conn, params=[wrangler_version, last_key, batch_size])
+        if not len(rows):
+            break
+        wrangled = get_wrangled_columns(rows)
+        wrangled[key] = rows[key].astype(object)
+        with create_connection() as conn:
+            conn.cursor().executemany(update_query, wrangled.values.tolist())
+            conn.commit()
+        last_key, total = int(rows[key].iloc[-1]), total + len(rows)
+        logger.info(f"wrangled {total} rows of `{table_name}` so far")
+    return total
+
+
+def wrangle(df, vectorized=load_config()["wrangler"]["vectorized"]):
     """Applies custom cleaning fucntions to each column of company project entries and
     web CSP certificates based on domain knowledge of common amiguities and filler phrases.
     
     Parameters:
     `df` (pd.DataFrame): table from scrape function or databse extraction consisting of rows
     representing raw input of company project entries or certificates from CSP sources.
+    `vectorized` (bool): whether to clean each unique string once through pandas string
+    methods (see `apply_clean_op`) rather than applying cleaning functions row by row. Both
+    give the same result.
+
+    Values persisted by a current `wrangler_version` in `wrangled_columns` (see
+    `get_wrangled_columns`) are used as is rather than cleaned again, and these columns are
+    dropped from the returned dataframe.
 
     Returns:
     A wrangled version of the same dataframe that was passed into the function as a parameter.
@@ -230,27 +688,104 @@ def wrangle(df):
     """
     if not isinstance(df, pd.DataFrame):
         raise TypeError("Need to pass in a DataFrame!")
-    clean_ops = {
-        "job_number": clean_job_number,
-        "pub_date": clean_pub_date,
-        "city": clean_city,
-        "title": clean_title,
-        "owner": clean_company_name,
-        "contractor": clean_company_name,
-        "engineer": clean_company_name,
-    }
-    for attr in clean_ops:
-        try:
-            df[attr] = df[attr].apply(clean_ops[attr])
-        except (KeyError, AttributeError):
-            pass
-    get_address_ops = {
-        "street_number": get_street_number,
-        "street_name": get_street_name,
-    }
-    for attr in get_address_ops:
-        df[attr] = df["address"].astype("str").apply(get_address_ops[attr])
-    for attr in ["title", "owner", "contractor"]:
-        df[f"{attr}_acronyms"] = df[attr].apply(get_acronyms)
-    df["total_string_dump"] = df.apply(concat_all_fields, axis=1)
+    vectorized = vectorized and len(df) > 0
+    persisted = {}
+    if "wrangler_version" in df:
+        is_current = (df.wrangler_version == wrangler_version).values
+        for attr in persisted_attrs:
+            if f"wrangled_{attr}" in df:
+                persisted[attr] = df[f"wrangled_{attr}"].where(is_current)
+        df = df.drop(columns=[col for col in wrangled_columns if col in df])
+    with profile("wrangle", len(df)):
+        for attr in clean_ops:
+            try:
+                with profile(f"wrangle/{attr}", len(df)):
+                    df[attr] = clean_column(
+                        df[attr], clean_ops[attr], vectorized, persisted.get(attr)
+                    )
+            except (KeyError, AttributeError):
+                pass
+        for attr in get_address_ops:
+            with profile(f"wrangle/{attr}", len(df)):
+                df[attr] = clean_column(
+                    df["address"].astype("str"),
+                    get_address_ops[attr],
+                    vectorized,
+                    persisted.get(attr),
+                )
+        for attr in acronym_attrs:
+            with profile(f"wrangle/{attr}_acronyms", len(df)):
+                if vectorized:
+                    df[f"{attr}_acronyms"] = df[attr].map(str).str.findall(acronym_pattern)
+                else:
+                    df[f"{attr}_acronyms"] = df[attr].apply(get_acronyms)
+        with profile("wrangle/total_string_dump", len(df)):
+            if vectorized:
+                df["total_string_dump"] = concat_all_fields_series(df)
+            else:
+                df["total_string_dump"] = df.apply(concat_all_fields, axis=1)
     return df
+
+
+def wrangle_rows(df, vectorized=load_config()["wrangler"]["vectorized"]):
+    """Wrangles `df` as if each of its rows was wrangled on its own, like
+    `wrangle(row.to_frame().transpose())` would, but in as few `wrangle` calls as possible.
+
+    `wrangle` leaves a whole column uncleaned as soon as one of its values can't be cleaned
+    (e.g. a missing city), so rows get grouped by which of their values can't be cleaned and
+    each group is wrangled at once.
+
+    Parameters:
+    `df` (pd.DataFrame): see `wrangle`.
+    `vectorized` (bool): see `wrangle`.
+
+    Returns:
+    A wrangled version of `df`, with rows in the same order.
+
+    """
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("Need to pass in a DataFrame!")
+
+    def fails(value, clean_op):
+        if isinstance(value, str):
+            return False
+        try:
+            clean_op(value)
+            return False
+        except AttributeError:
+            return True
+
+    signatures = pd.DataFrame(
+        {
+            attr: [fails(value, clean_ops[attr]) for value in df[attr].values]
+            for attr in clean_ops
+            if attr in df
+        },
+        index=range(len(df)),
+    )
+    if signatures.empty or not signatures.values.any():
+        return wrangle(df.copy(), vectorized=vectorized)
+    groups = signatures.groupby(list(signatures.columns), sort=False).indices.values()
+    return pd.concat(
+        [wrangle(df.iloc[positions].copy(), vectorized=vectorized) for positions in groups]
+    ).iloc[np.argsort(np.concatenate(list(groups)), kind="stable")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Persists wrangled columns of rows that aren't wrangled with the current "
+        "version of wrangler yet."
+    )
+    parser.add_argument(
+        "table_name",
+        type=str,
+        help="`web_certificates` or `company_projects`",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=10000,
+        help="number of rows to wrangle and update at a time",
+    )
+    args = parser.parse_args()
+    backfill_wrangled_columns(args.table_name, batch_size=args.batch_size)